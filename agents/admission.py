@@ -0,0 +1,276 @@
+"""
+Admission control for the chat pipeline.
+
+AdmissionController bounds how many chat requests a worker processes at once:
+beyond CHAT_MAX_IN_FLIGHT, requests wait in a queue of at most CHAT_MAX_QUEUE
+for up to CHAT_QUEUE_TIMEOUT seconds, and anything more is shed with a 503
+straight away. Requests that can be answered from caches skip the queue.
+
+UpstreamLimiter caps each upstream service with a token bucket and a maximum
+number of calls in flight; http_client takes a slot before every attempt, so
+traffic spikes queue here instead of turning into 429s from the upstream.
+Calls made inside background() (the cache warmer, /chat/batch) may only hold
+part of the slots, so the rest are always free for live requests; they queue
+for a slot for as long as their own deadline allows.
+"""
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from agents import deadline, metrics
+from agents.rate_limit import TokenBucket
+
+CHAT_MAX_IN_FLIGHT = int(os.environ.get("CHAT_MAX_IN_FLIGHT", "64"))  # per worker process
+CHAT_MAX_QUEUE = int(os.environ.get("CHAT_MAX_QUEUE", "128"))
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "1"))
+# Longest a live upstream call waits for a slot when no request deadline is tighter
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "2"))
+# Share of each upstream's slots background work may hold; with two or more slots, at least one is kept for live requests
+UPSTREAM_BACKGROUND_SHARE = float(os.environ.get("UPSTREAM_BACKGROUND_SHARE", "0.5"))
+
+_background: contextvars.ContextVar[bool] = contextvars.ContextVar("background", default=False)
+
+
+class UpstreamBusy(Exception):
+    """Raised when an upstream call could not get a slot in time."""
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = CHAT_MAX_IN_FLIGHT, max_queue: int = CHAT_MAX_QUEUE,
+                 queue_timeout: float = CHAT_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {"admitted": 0, "queued": 0, "fast_lane": 0, "shed": 0, "timed_out": 0}
+
+    def admit(self) -> bool:
+        """
+        Takes a processing slot, waiting in the queue if needed. Returns False when the
+        queue is full or the wait timed out; the caller should answer 503.
+        """
+        with self._cond:
+            if self._in_flight < self.max_in_flight:
+                return self._take("admitted")
+            if self._waiting >= self.max_queue:
+                return self._reject("shed")
+            self._waiting += 1
+            metrics.CHAT_QUEUED.set(self._waiting)
+            try:
+                give_up = time.monotonic() + self.queue_timeout
+                while self._in_flight >= self.max_in_flight:
+                    left = give_up - time.monotonic()
+                    if left <= 0:
+                        return self._reject("timed_out")
+                    self._cond.wait(left)
+                return self._take("queued")
+            finally:
+                self._waiting -= 1
+                metrics.CHAT_QUEUED.set(self._waiting)
+
+    async def admit_async(self) -> bool:
+        """Async counterpart of admit(); queued requests poll for a slot instead of blocking the loop."""
+        with self._cond:
+            if self._in_flight < self.max_in_flight:
+                return self._take("admitted")
+            if self._waiting >= self.max_queue:
+                return self._reject("shed")
+            self._waiting += 1
+            metrics.CHAT_QUEUED.set(self._waiting)
+        try:
+            give_up = time.monotonic() + self.queue_timeout
+            delay = 0.005
+            while True:
+                left = give_up - time.monotonic()
+                if left <= 0:
+                    with self._cond:
+                        return self._reject("timed_out")
+                await asyncio.sleep(min(delay, left))
+                delay = min(delay * 2, 0.1)
+                with self._cond:
+                    if self._in_flight < self.max_in_flight:
+                        return self._take("queued")
+        finally:
+            with self._cond:
+                self._waiting -= 1
+                metrics.CHAT_QUEUED.set(self._waiting)
+
+    def skip_queue(self) -> None:
+        """Counts a request that was let through without a slot because caches can answer it."""
+        with self._cond:
+            self._stats["fast_lane"] += 1
+        metrics.ADMISSIONS.inc(result="fast_lane")
+
+    def _take(self, result: str) -> bool:
+        self._in_flight += 1
+        self._stats[result] += 1
+        metrics.ADMISSIONS.inc(result=result)
+        return True
+
+    def _reject(self, result: str) -> bool:
+        self._stats[result] += 1
+        metrics.ADMISSIONS.inc(result=result)
+        return False
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            stats["waiting"] = self._waiting
+        return stats
+
+
+class UpstreamLimiter:
+    """
+    At most max_in_flight concurrent calls and, if rate is set, rate calls per second.
+    Background calls may hold at most max_background of the slots.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, rate: float = 0, burst: float = 1,
+                 background_share: float = UPSTREAM_BACKGROUND_SHARE):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_background = max(min(int(max_in_flight * background_share), max_in_flight - 1), 1)
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self._in_flight = 0
+        self._background = 0
+        self._cond = threading.Condition()
+        self._stats = {"calls": 0, "background_calls": 0, "waited": 0, "rejected": 0}
+
+    def _try_take(self, background: bool) -> bool:
+        # Caller holds the condition
+        if self._in_flight >= self.max_in_flight:
+            return False
+        if background and self._background >= self.max_background:
+            return False
+        if self.bucket is not None and not self.bucket.try_acquire():
+            return False
+        self._in_flight += 1
+        self._stats["calls"] += 1
+        if background:
+            self._background += 1
+            self._stats["background_calls"] += 1
+        return True
+
+    def _bucket_wait(self) -> float:
+        return 1 / self.bucket.rate if self.bucket is not None else 0.05
+
+    def acquire(self) -> bool:
+        """
+        Takes a slot, waiting up to the time the request has left; raises UpstreamBusy
+        otherwise. Returns whether it is a background slot, to pass to release().
+        """
+        background = _background.get()
+        give_up = time.monotonic() + _slot_timeout(background)
+        with self._cond:
+            if self._try_take(background):
+                return background
+            self._stats["waited"] += 1
+            while True:
+                left = give_up - time.monotonic()
+                if left <= 0:
+                    self._stats["rejected"] += 1
+                    metrics.UPSTREAM_THROTTLED.inc(upstream=self.name)
+                    raise UpstreamBusy(f"{self.name} is busy")
+                # Slots free up via release(); tokens refill on their own, so wake up for those too
+                self._cond.wait(min(left, self._bucket_wait()))
+                if self._try_take(background):
+                    return background
+
+    async def acquire_async(self) -> bool:
+        background = _background.get()
+        give_up = time.monotonic() + _slot_timeout(background)
+        delay = 0.005
+        with self._cond:
+            if self._try_take(background):
+                return background
+            self._stats["waited"] += 1
+        while True:
+            left = give_up - time.monotonic()
+            if left <= 0:
+                with self._cond:
+                    self._stats["rejected"] += 1
+                metrics.UPSTREAM_THROTTLED.inc(upstream=self.name)
+                raise UpstreamBusy(f"{self.name} is busy")
+            # Threads and event loops share the limiter, so async waiters poll with backoff
+            await asyncio.sleep(min(delay, left))
+            delay = min(delay * 2, 0.1)
+            with self._cond:
+                if self._try_take(background):
+                    return background
+
+    def release(self, background: bool = False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if background:
+                self._background -= 1
+            # Waiters differ in which slots they may take, so wake them all
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+            stats["background_in_flight"] = self._background
+            stats["max_in_flight"] = self.max_in_flight
+            stats["max_background"] = self.max_background
+        return stats
+
+
+@contextmanager
+def background():
+    """
+    Marks the upstream calls made in the enclosed block as background work: bulk
+    callers that would rather wait for a slot than fail, but not at live traffic's expense.
+    """
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def _slot_timeout(background: bool = False) -> float:
+    left = deadline.remaining()
+    if background:
+        return math.inf if left is None else max(left, 0)
+    return UPSTREAM_QUEUE_TIMEOUT if left is None else max(min(left, UPSTREAM_QUEUE_TIMEOUT), 0)
+
+
+_upstreams: List[Tuple[str, UpstreamLimiter]] = []
+
+
+def limit_upstream(name: str, base_url: str, max_in_flight: int, rate: float = 0, burst: float = 1) -> UpstreamLimiter:
+    """Registers limits for every URL under base_url."""
+    limiter = UpstreamLimiter(name, max_in_flight, rate, burst)
+    _upstreams.append((base_url, limiter))
+    return limiter
+
+
+def upstream_limiter(url: str) -> Optional[UpstreamLimiter]:
+    for base_url, limiter in _upstreams:
+        if url.startswith(base_url):
+            return limiter
+    return None
+
+
+chat_admission = AdmissionController()
+
+
+def get_stats() -> Dict[str, dict]:
+    """Chat queue counters and per-upstream slot usage."""
+    stats = {"chat": chat_admission.stats()}
+    for _, limiter in _upstreams:
+        stats[limiter.name] = limiter.stats()
+    return stats
@@ -0,0 +1,549 @@
+import asyncio
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from agents import metrics
+from agents.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Shared cache backend used behind every agent's in-process LRU:
+#   memory - none (only caches given an explicit path, like geocoding, persist to SQLite)
+#   sqlite - one SQLite file in WAL mode, shared by all workers on the host
+#   redis  - a Redis-protocol server, shared by all hosts
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+_DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "shared.sqlite3")
+CACHE_PATH = os.environ.get("CACHE_PATH", _DEFAULT_CACHE_PATH)
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_REDIS_TIMEOUT = float(os.environ.get("CACHE_REDIS_TIMEOUT", "0.25"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # per SQLite file
+
+# Serialized values at least this long are zlib-compressed
+_COMPRESS_MIN = 512
+
+
+class CacheError(Exception):
+    """A shared cache backend failed or answered with an error."""
+
+
+def encode(value: Any) -> bytes:
+    """
+    Compact serialized form for shared backends: minified UTF-8 JSON behind a
+    one-byte tag, zlib-compressed when large. Tuples come back as lists.
+    """
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) >= _COMPRESS_MIN:
+        return b"z" + zlib.compress(data)
+    return b"j" + data
+
+
+def decode(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == b"z":
+        body = zlib.decompress(body)
+    elif tag != b"j":
+        raise CacheError(f"unknown value encoding {tag!r}")
+    return json.loads(body)
+
+
+class CacheBackend:
+    """
+    Interface for the stores behind TieredCache. Keys are strings; implementations
+    must be safe to use from several threads.
+    """
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """Returns (value, expires_at) for a live entry, or None."""
+        raise NotImplementedError
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self, prefix: str = "") -> None:
+        """Removes every entry whose key starts with prefix."""
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """
+    Thread-safe in-process LRU cache with optional per-entry expiry.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            if not prefix:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def items(self) -> List[Tuple[str, Any, Optional[float]]]:
+        """Live entries as (key, value, expires_at), least recently used first."""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value, expires_at)
+                for key, (value, expires_at) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Key/value store backed by a SQLite file in WAL mode, so every worker process
+    on the host can share it. Values are stored encoded (see encode). Once the
+    file holds more than max_bytes, expired and then least recently written
+    entries are evicted.
+    """
+
+    # Evictions are checked every this many writes per process
+    EVICT_CHECK_INTERVAL = 100
+    # File layout version, kept in PRAGMA user_version
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: str, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        with self._lock:
+            self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection inherited across fork (gunicorn --preload) must not be reused
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+            conn.commit()
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                self._migrate(conn)
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """
+        One-time upgrade of a file from before user_version was set: drops the table
+        of JSON text values used before values were encoded. A `cache` table with any
+        other columns is not ours and is left alone.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated the file while this one waited
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                columns = [row[1] for row in conn.execute("PRAGMA table_info(cache)")]
+                if columns == ["key", "value", "expires_at"]:
+                    conn.execute("DROP TABLE cache")
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return decode(value), expires_at
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        data = encode(value)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, data, expires_at),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_CHECK_INTERVAL == 0:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        total, count = conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(key) + LENGTH(value)), 0), COUNT(*) FROM entries"
+        ).fetchone()
+        if total <= self.max_bytes or not count:
+            return
+        # Replacing a row gives it a new rowid, so the lowest rowids were written longest ago.
+        # Drop enough of them to get back to 90% of the limit.
+        drop = int((total - self.max_bytes * 0.9) / (total / count)) + 1
+        conn.execute("DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY rowid LIMIT ?)", (drop,))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.commit()
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            conn.commit()
+
+
+class _RespConnection:
+    """One connection speaking the Redis serialization protocol (RESP2)."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    def pipeline(self, commands) -> list:
+        """Sends all commands in one write and returns their replies in order."""
+        payload = bytearray()
+        for command in commands:
+            payload += b"*%d\r\n" % len(command)
+            for arg in command:
+                arg = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+                payload += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        self.sock.sendall(payload)
+        return [self._read_reply() for _ in commands]
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise CacheError(rest.decode("utf-8"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise CacheError(f"unexpected reply {line!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(CacheBackend):
+    """
+    Store on a Redis-protocol server (redis://[:password@]host:port/db), shared by
+    every worker and host. Values are stored encoded (see encode) and every entry
+    gets a TTL; size is bounded by the server's maxmemory with an LRU policy.
+    When the server is unreachable, calls fail fast for a while instead of each
+    waiting for the connect timeout.
+    """
+
+    def __init__(self, url: str, timeout: float = CACHE_REDIS_TIMEOUT, pool_size: int = 8):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.password = unquote(parts.password) if parts.password else None
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle: List[_RespConnection] = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._breaker = CircuitBreaker(f"redis:{self.host}:{self.port}", failure_threshold=3, cooldown=5)
+
+    def _acquire(self) -> _RespConnection:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle, self._pid = [], os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            conn.pipeline(setup)
+        return conn
+
+    def _release(self, conn: _RespConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.pool_size and self._pid == os.getpid():
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def execute(self, *commands) -> list:
+        """Runs commands as one pipeline and returns their replies."""
+        self._breaker.before_call()
+        start = time.monotonic()
+        conn = None
+        try:
+            conn = self._acquire()
+            replies = conn.pipeline(commands)
+        except (OSError, CacheError):
+            if conn is not None:
+                conn.close()
+            self._breaker.record(time.monotonic() - start, True)
+            raise
+        self._breaker.record(time.monotonic() - start, False)
+        self._release(conn)
+        return replies
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        data, ttl_ms = self.execute(("GET", key), ("PTTL", key))
+        if data is None:
+            return None
+        expires_at = time.time() + ttl_ms / 1000 if ttl_ms >= 0 else None
+        return decode(data), expires_at
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        command = ("SET", key, encode(value))
+        if ttl is not None:
+            command += ("PX", max(int(ttl * 1000), 1))
+        self.execute(command)
+
+    def delete(self, key: str) -> None:
+        self.execute(("DEL", key))
+
+    def clear(self, prefix: str = "") -> None:
+        cursor = b"0"
+        while True:
+            cursor, keys = self.execute(("SCAN", cursor, "MATCH", prefix + "*", "COUNT", 500))[0]
+            if keys:
+                self.execute(("DEL", *keys))
+            if cursor == b"0":
+                break
+
+
+# Errors from a shared backend only cost a cache miss
+BACKEND_ERRORS = (sqlite3.Error, OSError, CacheError, CircuitOpenError)
+
+_MISSING = object()
+
+
+def _report(operation: str, error: Exception) -> None:
+    # An open circuit already reported the failures that opened it
+    if not isinstance(error, CircuitOpenError):
+        print(f"Cache: shared {operation} failed: {error}")
+
+
+class TieredCache:
+    """
+    In-process LRU in front of an optional shared backend (SQLite, Redis).
+    Entries found only in the shared backend are promoted into memory. Keeps hit/miss counters.
+    Coroutines use get_async and set_async, which leave the event loop while the
+    shared backend does its disk or network I/O.
+    """
+
+    def __init__(self, memory: LRUCache, shared: Optional[CacheBackend] = None, name: str = "cache"):
+        self.name = name
+        self.memory = memory
+        self.shared = shared
+        # Several caches can share one backend, so their keys are namespaced there
+        self._prefix = f"{name}:"
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+        metrics.CACHE_REQUESTS.inc(cache=self.name, result=name)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is _MISSING:
+            value = self._shared_get(key)
+        return default if value is _MISSING else value
+
+    async def get_async(self, key: str, default: Any = None) -> Any:
+        value = self._memory_get(key)
+        if value is _MISSING:
+            value = await self._off_loop(self._shared_get, key)
+        return default if value is _MISSING else value
+
+    def _memory_get(self, key: str) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("memory_hits")
+        return value
+
+    def _shared_get(self, key: str) -> Any:
+        """Reads a memory miss through to the shared backend and promotes a hit into memory."""
+        if self.shared is not None:
+            try:
+                entry = self.shared.get_entry(self._prefix + key)
+            except BACKEND_ERRORS as e:
+                _report("read", e)
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                self._count("shared_hits")
+                ttl = expires_at - time.time() if expires_at is not None else None
+                self.memory.set(key, value, ttl)
+                return value
+
+        self._count("misses")
+        return _MISSING
+
+    async def _off_loop(self, func, *args):
+        # Only the shared backend blocks; memory-only caches answer on the loop
+        if self.shared is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """
+        When a live entry expires (math.inf if never), or None without one.
+        Used to refresh entries ahead of time; not counted as a lookup.
+        """
+        entry = self.memory.get_entry(key)
+        if entry is None and self.shared is not None:
+            try:
+                entry = self.shared.get_entry(self._prefix + key)
+            except BACKEND_ERRORS as e:
+                _report("read", e)
+        if entry is None:
+            return None
+        return entry[1] if entry[1] is not None else math.inf
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        self._shared_set(key, value, ttl)
+
+    async def set_async(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.memory.set(key, value, ttl)
+        await self._off_loop(self._shared_set, key, value, ttl)
+
+    def _shared_set(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        if self.shared is not None:
+            try:
+                self.shared.set(self._prefix + key, value, ttl)
+            except BACKEND_ERRORS as e:
+                _report("write", e)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear(self._prefix)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hits"] = stats["memory_hits"] + stats["shared_hits"]
+        stats["memory_size"] = len(self.memory)
+        stats["backend"] = type(self.shared).__name__ if self.shared is not None else None
+        return stats
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _shared_backend(path: Optional[str]) -> Optional[CacheBackend]:
+    """The configured shared backend; caches using the same file or server share one instance."""
+    if CACHE_BACKEND == "redis":
+        key = ("redis", CACHE_REDIS_URL)
+        factory = lambda: RedisCache(CACHE_REDIS_URL)
+    elif CACHE_BACKEND == "sqlite" or path:
+        path = path or CACHE_PATH
+        key = ("sqlite", os.path.abspath(path))
+        factory = lambda: SQLiteCache(path)
+    else:
+        return None
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = _backends[key] = factory()
+        return backend
+
+
+def open_cache(name: str, maxsize: int, path: Optional[str] = None) -> TieredCache:
+    """
+    Builds an agent's cache: an in-process LRU of maxsize entries in front of the
+    CACHE_BACKEND shared store. A path keeps the cache in that SQLite file even
+    with the memory backend (Redis takes precedence when configured).
+    """
+    shared = None
+    try:
+        shared = _shared_backend(path)
+    except BACKEND_ERRORS as e:
+        print(f"Cache: shared {name} cache disabled ({e})")
+    return TieredCache(LRUCache(maxsize), shared, name=name)
@@ -0,0 +1,94 @@
+"""
+Per-host circuit breakers for upstream calls. After enough consecutive failed
+or slow calls a host's circuit opens and calls to it fail fast for a cool-down
+period; then one trial call decides whether it closes again.
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+from agents import metrics
+
+# Consecutive failed (error, 429/5xx or slow) calls that open a circuit
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_COOLDOWN = float(os.environ.get("CIRCUIT_COOLDOWN", "30"))  # seconds a circuit stays open
+CIRCUIT_SLOW_CALL = float(os.environ.get("CIRCUIT_SLOW_CALL", "5"))  # calls slower than this count as failures
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 cooldown: float = CIRCUIT_COOLDOWN, slow_call: float = CIRCUIT_SLOW_CALL):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._stats = {"opened": 0, "rejected": 0}
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError unless a call to the host may go ahead."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                return
+            self._stats["rejected"] += 1
+        metrics.CIRCUIT_REJECTIONS.inc(host=self.host)
+        raise CircuitOpenError(f"circuit open for {self.host}")
+
+    def record(self, elapsed: float, failed: Optional[bool]) -> None:
+        """
+        Records a finished call. failed=None marks an inconclusive call, such as
+        one the caller cancelled, unless it was slow anyway.
+        """
+        with self._lock:
+            self._probing = False
+            if failed or elapsed >= self.slow_call:
+                self._failures += 1
+                if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+                    if self.state != OPEN:
+                        self._stats["opened"] += 1
+                    self._set_state(OPEN)
+            elif failed is False:
+                self._failures = 0
+                self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.CIRCUIT_STATE.set(_STATE_VALUES[state], host=self.host)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["state"] = self.state
+            stats["consecutive_failures"] = self._failures
+        return stats
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+def get_stats() -> dict:
+    """State, consecutive failures, times opened and calls rejected, per host."""
+    return {host: breaker.stats() for host, breaker in list(_breakers.items())}
@@ -0,0 +1,55 @@
+"""
+Request-level deadlines. ParentAgent opens a scope per message; every upstream
+call made inside it (on this thread, the shared executor or the agent loop)
+is given only the time that is left.
+"""
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Default time budget for one chat message in seconds; 0 disables the deadline
+CHAT_DEADLINE = float(os.environ.get("CHAT_DEADLINE", "3"))
+# Time budget for a whole /chat/batch call; a bulk call, so 0 (no deadline) by default
+BATCH_DEADLINE = float(os.environ.get("BATCH_DEADLINE", "0"))
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting an upstream call when the request has no time left."""
+
+
+@contextmanager
+def scope(seconds: Optional[float]):
+    """
+    Sets a deadline `seconds` from now for the enclosed calls. An enclosing
+    scope that ends sooner wins; None or 0 leaves the current deadline as is.
+    """
+    current = _deadline.get()
+    if seconds:
+        ends_at = time.monotonic() + seconds
+        if current is None or ends_at < current:
+            current = ends_at
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (may be negative), or None without one."""
+    ends_at = _deadline.get()
+    return None if ends_at is None else ends_at - time.monotonic()
+
+
+def clamp(timeout: float) -> float:
+    """Shortens a timeout to the time left; raises DeadlineExceeded when none is."""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return min(timeout, left)
@@ -0,0 +1,57 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Upper bound on agent calls running at the same time across the whole process
+AGENT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "16"))
+
+_executor = None
+_loop = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the process-wide thread pool used to run independent agent calls concurrently.
+    It is created lazily so forked workers (e.g. gunicorn) each get their own threads.
+    """
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=AGENT_MAX_WORKERS, thread_name_prefix="agent")
+    return _executor
+
+
+def submit(func, *args) -> Future:
+    """
+    Runs func(*args) on the shared executor inside a copy of the caller's context,
+    so per-request state such as stage timings follows the call onto the worker thread.
+    """
+    context = contextvars.copy_context()
+    return get_executor().submit(context.run, func, *args)
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide event loop for async agent calls, running in a daemon thread.
+    Keeping one long-lived loop lets every request share the same pooled async HTTP client.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_async(coro) -> Future:
+    """
+    Schedules a coroutine on the shared agent loop and returns a concurrent Future.
+    The task runs in a copy of the caller's context, like submit().
+    """
+    return contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coro, get_event_loop())
@@ -0,0 +1,269 @@
+"""
+Offline gazetteer: a compact, memory-mapped index of place names so common
+locations resolve without calling Photon.
+
+Build an index from a GeoNames dump (e.g. IN.txt or cities15000.txt) or an
+OSM-style TSV export, then point GAZETTEER_PATH at it:
+
+    python -m agents.gazetteer build --format geonames IN.txt data/gazetteer.idx
+    python -m agents.gazetteer lookup data/gazetteer.idx "bangalore"
+
+The OSM-style TSV needs a header row with the columns
+name, alt_names, lat, lon, country_code, osm_type, osm_id, admin_level, population
+(alt_names comma-separated, osm_type one of R/W/N).
+
+File layout (little-endian):
+    header   magic "GZT1", uint32 record count
+    offsets  uint32 per record, pointing at its record
+    records  uint16 key length, UTF-8 key, then lat, lon (float64), osm_id (int64, -1 if
+             unknown), osm_type (1 byte, b"-" if unknown), score (float64)
+Records are sorted by key bytes, and by descending score within a key, so an
+exact lookup is a binary search and the best match for a name comes first.
+The file is opened read-only with mmap, so gunicorn workers share its pages
+through the OS page cache instead of each loading a copy.
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+_MAGIC = b"GZT1"
+_HEADER = struct.Struct("<4sI")
+_OFFSET = struct.Struct("<I")
+_KEY_LEN = struct.Struct("<H")
+_VALUE = struct.Struct("<ddqcd")
+
+_TYPE_NAMES = {b"R": "relation", b"W": "way", b"N": "node"}
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "gazetteer.idx")
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", _DEFAULT_PATH)
+
+Coordinates = Tuple[float, float, Optional[int], Optional[str]]
+
+
+class Gazetteer:
+    """
+    Read-only view of a gazetteer index file. Keys are normalized place names
+    (see agents.geocoding.normalize_place_name).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _record(self, index: int) -> Tuple[bytes, int]:
+        """Returns (key, offset of the value) for the record at index."""
+        offset = _OFFSET.unpack_from(self._mm, _HEADER.size + index * _OFFSET.size)[0]
+        key_len = _KEY_LEN.unpack_from(self._mm, offset)[0]
+        start = offset + _KEY_LEN.size
+        return self._mm[start:start + key_len], start + key_len
+
+    def _value(self, value_offset: int) -> Tuple[Coordinates, float]:
+        lat, lon, osm_id, osm_type, score = _VALUE.unpack_from(self._mm, value_offset)
+        return (lat, lon, osm_id if osm_id >= 0 else None, _TYPE_NAMES.get(osm_type)), score
+
+    def _lower_bound(self, key: bytes) -> int:
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def lookup(self, key: str) -> Optional[Coordinates]:
+        """Best-ranked coordinates for an exact normalized name, or None."""
+        encoded = key.encode("utf-8")
+        index = self._lower_bound(encoded)
+        if index < self._count:
+            found, value_offset = self._record(index)
+            if found == encoded:
+                return self._value(value_offset)[0]
+        return None
+
+    def prefix_lookup(self, prefix: str, limit: int = 10) -> List[Tuple[str, Coordinates]]:
+        """
+        Names starting with prefix, best-ranked first (one result per name).
+        """
+        encoded = prefix.encode("utf-8")
+        matches = []
+        last_key = None
+        index = self._lower_bound(encoded)
+        while index < self._count:
+            key, value_offset = self._record(index)
+            if not key.startswith(encoded):
+                break
+            # The first record for each key is its best match
+            if key != last_key:
+                coords, score = self._value(value_offset)
+                matches.append((score, key.decode("utf-8"), coords))
+                last_key = key
+            index += 1
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return [(name, coords) for _, name, coords in matches[:limit]]
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+_gazetteer = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_gazetteer() -> Optional[Gazetteer]:
+    """Opens GAZETTEER_PATH once per process; returns None if there is no index."""
+    global _gazetteer, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+                    try:
+                        _gazetteer = Gazetteer(GAZETTEER_PATH)
+                    except (OSError, ValueError) as e:
+                        print(f"Gazetteer: could not open {GAZETTEER_PATH}: {e}")
+                _loaded = True
+    return _gazetteer
+
+
+def lookup(key: str) -> Optional[Coordinates]:
+    """Exact lookup of a normalized name in the configured index, if any."""
+    gazetteer = get_gazetteer()
+    return gazetteer.lookup(key) if gazetteer is not None else None
+
+
+# --- Building ---------------------------------------------------------------
+
+# GeoNames administrative feature codes mapped to OSM-style admin levels
+_GEONAMES_ADMIN_LEVELS = {"ADM1": "4", "ADM2": "5", "ADM3": "6", "ADM4": "8"}
+
+
+def read_geonames(path: str) -> Iterator[Dict]:
+    """Yields populated places and administrative areas from a GeoNames dump."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 15 or cols[6] not in ("P", "A"):
+                continue
+            yield {
+                "names": [cols[1], cols[2]] + [n for n in cols[3].split(",") if n],
+                "lat": float(cols[4]),
+                "lon": float(cols[5]),
+                "countrycode": cols[8],
+                "osm_type": None,
+                "osm_id": None,
+                "admin_level": _GEONAMES_ADMIN_LEVELS.get(cols[7]),
+                "population": cols[14] or None,
+            }
+
+
+def read_osm_tsv(path: str) -> Iterator[Dict]:
+    """Yields places from an OSM-style TSV export (see module docstring)."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            yield {
+                "names": [row["name"]] + [n for n in (row.get("alt_names") or "").split(",") if n],
+                "lat": float(row["lat"]),
+                "lon": float(row["lon"]),
+                "countrycode": row.get("country_code") or "",
+                "osm_type": row.get("osm_type") or None,
+                "osm_id": int(row["osm_id"]) if row.get("osm_id") else None,
+                "admin_level": row.get("admin_level") or None,
+                "population": row.get("population") or None,
+            }
+
+
+def build_index(places: Iterable[Dict], output_path: str) -> int:
+    """
+    Writes an index for places (as yielded by the readers) and returns the number of records.
+    Places are ranked with the same score_feature used for Photon results.
+    """
+    # Imported here: geocoding itself consults the gazetteer at lookup time
+    from agents.geocoding import normalize_place_name, score_feature
+
+    records = []
+    for place in places:
+        props = {
+            "countrycode": place["countrycode"],
+            "osm_type": place["osm_type"],
+            "admin_level": place["admin_level"],
+            "population": place["population"],
+        }
+        score = score_feature({"properties": props})
+        osm_type = (place["osm_type"] or "-").encode("ascii")[:1]
+        osm_id = place["osm_id"] if place["osm_id"] is not None else -1
+        value = _VALUE.pack(place["lat"], place["lon"], osm_id, osm_type, score)
+        for key in {normalize_place_name(name) for name in place["names"]}:
+            encoded = key.encode("utf-8")
+            if encoded and len(encoded) <= 0xFFFF:
+                records.append((encoded, -score, value))
+
+    records.sort(key=lambda record: (record[0], record[1]))
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(records)))
+        offset = _HEADER.size + len(records) * _OFFSET.size
+        for key, _, value in records:
+            f.write(_OFFSET.pack(offset))
+            offset += _KEY_LEN.size + len(key) + len(value)
+        for key, _, value in records:
+            f.write(_KEY_LEN.pack(len(key)))
+            f.write(key)
+            f.write(value)
+    # Replace atomically so running workers keep their existing mapping
+    os.replace(tmp_path, output_path)
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the offline gazetteer index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="build an index from a place dump")
+    build.add_argument("--format", choices=["geonames", "osm"], default="geonames")
+    build.add_argument("source")
+    build.add_argument("output")
+
+    query = commands.add_parser("lookup", help="look up a name (prefix match with --prefix)")
+    query.add_argument("index")
+    query.add_argument("name")
+    query.add_argument("--prefix", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        reader = read_geonames if args.format == "geonames" else read_osm_tsv
+        count = build_index(reader(args.source), args.output)
+        print(f"Wrote {count} records to {args.output}")
+    else:
+        from agents.geocoding import normalize_place_name
+
+        gazetteer = Gazetteer(args.index)
+        key = normalize_place_name(args.name)
+        if args.prefix:
+            for name, coords in gazetteer.prefix_lookup(key):
+                print(name, coords)
+        else:
+            coords = gazetteer.lookup(key)
+            if coords is None:
+                sys.exit(f"{args.name!r} not found")
+            print(coords)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,287 @@
-import requests
+import os
+import re
+import time
+import unicodedata
 from typing import Optional, Tuple
+from agents import admission, gazetteer, http_client, metrics
+from agents.cache import open_cache
+from agents.negative_cache import negative_cache
+from agents.singleflight import SingleFlight
 
-def get_coordinates(place_name: str) -> Optional[Tuple[float, float, Optional[int], Optional[str]]]:
+# Cache configuration. Set GEOCODE_CACHE_PATH to an empty string to keep the cache in memory only,
+# or in the CACHE_BACKEND shared store when one is configured (see agents.cache).
+_DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "geocode.sqlite3")
+GEOCODE_CACHE_PATH = os.environ.get("GEOCODE_CACHE_PATH", _DEFAULT_CACHE_PATH)
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "2048"))
+GEOCODE_CACHE_TTL = float(os.environ.get("GEOCODE_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+
+# Alternate spellings that resolve to the same place share one cache entry
+PLACE_ALIASES = {
+    "bengaluru": "bangalore",
+    "bombay": "mumbai",
+    "madras": "chennai",
+    "calcutta": "kolkata",
+    "poona": "pune",
+    "mysuru": "mysore",
+    "gurgaon": "gurugram",
+    "trivandrum": "thiruvananthapuram",
+    "benares": "varanasi",
+    "banaras": "varanasi",
+    "pondicherry": "puducherry",
+    "cochin": "kochi",
+    "vizag": "visakhapatnam",
+    "baroda": "vadodara",
+}
+
+
+_cache = open_cache("geocode", GEOCODE_CACHE_SIZE, GEOCODE_CACHE_PATH or None)
+
+# Concurrent lookups of the same name share one Photon call
+_flight = SingleFlight("geocode")
+
+# Sentinels: _MISSING for "not in cache", _FETCH_FAILED for transport errors (which are not cached)
+_MISSING = object()
+_FETCH_FAILED = object()
+
+
+def normalize_place_name(place_name: str) -> str:
     """
-    Fetches coordinates and OSM details for a given place name using Photon API (Komoot).
-    Returns: (latitude, longitude, osm_id, osm_type)
+    Builds the cache key for a place name: case, whitespace, punctuation and common
+    aliases are folded so "  Bengaluru! " and "bangalore" share an entry.
     """
-    url = "https://photon.komoot.io/api/"
-    params = {
+    key = unicodedata.normalize("NFKC", place_name).casefold()
+    key = re.sub(r"[^\w\s]", " ", key)
+    key = " ".join(key.split())
+    return PLACE_ALIASES.get(key, key)
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the geocoding cache."""
+    return _cache.stats()
+
+
+PHOTON_URL = os.environ.get("PHOTON_URL", "https://photon.komoot.io/api/")
+PHOTON_MAX_IN_FLIGHT = int(os.environ.get("PHOTON_MAX_IN_FLIGHT", "8"))  # per worker process
+PHOTON_RATE = float(os.environ.get("PHOTON_RATE", "0"))  # calls per second, 0 for no limit
+
+admission.limit_upstream("photon", PHOTON_URL, PHOTON_MAX_IN_FLIGHT, PHOTON_RATE, burst=PHOTON_MAX_IN_FLIGHT)
+
+
+def score_feature(feature: dict) -> float:
+    """
+    Ranks a Photon feature. Prioritizes results by:
+    1. Country (India first, then other major countries)
+    2. Type: relation > way > node
+    3. Higher admin_level (lower number = more important)
+    4. Population (if available)
+    """
+    props = feature["properties"]
+    score = 0
+    
+    # HEAVILY prioritize India and other major countries
+    country_code = props.get("countrycode", "").upper()
+    if country_code == "IN":  # India
+        score += 10000
+    elif country_code in ["US", "GB", "CN", "BR", "DE", "FR", "JP"]:  # Major countries
+        score += 5000
+    elif country_code in ["AU", "NZ"]:  # Deprioritize Australia/NZ for Indian city names
+        score -= 5000
+    
+    # Prefer relations over ways over nodes
+    type_map = {'R': 300, 'W': 200, 'N': 100}
+    score += type_map.get(props.get("osm_type"), 0)
+    
+    # Prefer lower admin_level (e.g., 4 for state, 6 for city)
+    admin_level = props.get("admin_level")
+    if admin_level:
+        try:
+            score += (20 - int(admin_level)) * 10  # Lower admin_level = higher score
+        except:
+            pass
+    
+    # Prefer higher population
+    population = props.get("population")
+    if population:
+        try:
+            score += min(int(population) / 10000, 100)  # Cap at 100
+        except:
+            pass
+    
+    return score
+
+
+def _photon_params(place_name: str) -> dict:
+    return {
         "q": place_name,
         "limit": 5,  # Fetch multiple results to filter
         "osm_tag": ["place:city", "boundary:administrative"]
     }
-    
+
+
+def _parse_photon(data: dict, place_name: str):
+    """Picks the best-scored Photon feature. Returns the coordinates tuple or None."""
+    # A running best rather than a sort; ties go to the first feature, as before
+    feature = max(data.get("features") or [], key=score_feature, default=None)
+    if feature is not None:
+        props = feature["properties"]
+        coords = feature["geometry"]["coordinates"]
+        
+        lat = coords[1]
+        lon = coords[0]
+        osm_id = props.get("osm_id")
+        osm_type_char = props.get("osm_type")
+        
+        # Map Photon type char to full name
+        type_map = {'R': 'relation', 'W': 'way', 'N': 'node'}
+        osm_type = type_map.get(osm_type_char, osm_type_char)
+        
+        return lat, lon, osm_id, osm_type
+    else:
+        print(f"Geocoding: No data found for {place_name}.")
+        return None
+
+
+def _offline_coordinates(key: str):
+    """The gazetteer's coordinates for a key, None for a known miss, or _MISSING."""
+    result = gazetteer.lookup(key)
+    if result is not None:
+        metrics.LOCAL_INDEX_HITS.inc(index="gazetteer")
+        return result
+
+    if negative_cache.contains("geocode", key):
+        return None
+    return _MISSING
+
+
+def _from_cache(cached):
+    return cached if cached is _MISSING or cached is None else tuple(cached)
+
+
+def _local_coordinates(key: str):
+    """
+    Resolves a key without the network: the offline gazetteer first, then known
+    misses, then the cache. Returns the coordinates tuple, None for a known miss, or _MISSING.
+    """
+    result = _offline_coordinates(key)
+    if result is not _MISSING:
+        return result
+    return _from_cache(_cache.get(key, _MISSING))
+
+
+async def _local_coordinates_async(key: str):
+    result = _offline_coordinates(key)
+    if result is not _MISSING:
+        return result
+    return _from_cache(await _cache.get_async(key, _MISSING))
+
+
+def cached_coordinates(place_name: str):
+    """
+    Coordinates for a place if the gazetteer or this worker's cache has them, None
+    otherwise. Only peeks: nothing is fetched or counted as a cache lookup.
+    """
+    key = normalize_place_name(place_name)
+    if not key:
+        return None
+    result = gazetteer.lookup(key)
+    if result is None:
+        cached = _cache.memory.get(key)
+        result = tuple(cached) if cached else None
+    return result
+
+
+def _store_coordinates(key: str, result) -> None:
+    if result is None:
+        negative_cache.add("geocode", key)
+    elif result is not _FETCH_FAILED:
+        _cache.set(key, list(result), GEOCODE_CACHE_TTL)
+
+
+async def _store_coordinates_async(key: str, result) -> None:
+    if result is None:
+        negative_cache.add("geocode", key)
+    elif result is not _FETCH_FAILED:
+        await _cache.set_async(key, list(result), GEOCODE_CACHE_TTL)
+
+
+def warm_coordinates(place_name: str, refresh_ahead: float):
+    """
+    For the cache warmer: returns the coordinates like get_coordinates, but fetches
+    them again when the cached entry is missing or expires within refresh_ahead seconds.
+    """
+    key = normalize_place_name(place_name)
+    if not key:
+        return None
+    result = gazetteer.lookup(key)
+    if result is not None or negative_cache.contains("geocode", key):
+        return result
+
+    expires_at = _cache.expires_at(key)
+    if expires_at is not None and expires_at - time.time() > refresh_ahead:
+        cached = _cache.get(key)
+        if cached is not None:
+            return tuple(cached)
+    return _flight.do(key, _fetch_coordinates, key, place_name)
+
+
+def get_coordinates(place_name: str) -> Optional[Tuple[float, float, Optional[int], Optional[str]]]:
+    """
+    Fetches coordinates and OSM details for a given place name using Photon API (Komoot).
+    Names in the offline gazetteer resolve locally; other results are cached in memory
+    and in the shared cache, and misses are remembered in the negative cache.
+    Returns: (latitude, longitude, osm_id, osm_type)
+    """
+    key = normalize_place_name(place_name)
+    if not key:
+        return None
+
+    cached = _local_coordinates(key)
+    if cached is not _MISSING:
+        return cached
+
+    return _flight.do(key, _fetch_coordinates, key, place_name)
+
+
+async def get_coordinates_async(place_name: str) -> Optional[Tuple[float, float, Optional[int], Optional[str]]]:
+    """
+    Async counterpart of get_coordinates; shares its cache.
+    """
+    key = normalize_place_name(place_name)
+    if not key:
+        return None
+
+    cached = await _local_coordinates_async(key)
+    if cached is not _MISSING:
+        return cached
+
+    return await _flight.do_async(key, _fetch_coordinates_async, key, place_name)
+
+
+def _fetch_coordinates(key: str, place_name: str):
+    """
+    Queries Photon for a place name and caches the outcome under key.
+    Returns the coordinates tuple, or None if there is no match or the call failed.
+    """
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get(PHOTON_URL, params=_photon_params(place_name))
         response.raise_for_status()
-        data = response.json()
-        
-        if "features" in data and data["features"]:
-            # Prioritize results by:
-            # 1. Higher admin_level (lower number = more important)
-            # 2. Population (if available)
-            # 3. Type: relation > way > node
-            
-            def score_feature(feature):
-                props = feature["properties"]
-                score = 0
-                
-                # HEAVILY prioritize India and other major countries
-                country_code = props.get("countrycode", "").upper()
-                if country_code == "IN":  # India
-                    score += 10000
-                elif country_code in ["US", "GB", "CN", "BR", "DE", "FR", "JP"]:  # Major countries
-                    score += 5000
-                elif country_code in ["AU", "NZ"]:  # Deprioritize Australia/NZ for Indian city names
-                    score -= 5000
-                
-                # Prefer relations over ways over nodes
-                type_map = {'R': 300, 'W': 200, 'N': 100}
-                score += type_map.get(props.get("osm_type"), 0)
-                
-                # Prefer lower admin_level (e.g., 4 for state, 6 for city)
-                admin_level = props.get("admin_level")
-                if admin_level:
-                    try:
-                        score += (20 - int(admin_level)) * 10  # Lower admin_level = higher score
-                    except:
-                        pass
-                
-                # Prefer higher population
-                population = props.get("population")
-                if population:
-                    try:
-                        score += min(int(population) / 10000, 100)  # Cap at 100
-                    except:
-                        pass
-                
-                return score
-            
-            # Sort features by score
-            sorted_features = sorted(data["features"], key=score_feature, reverse=True)
-            feature = sorted_features[0]
-            
-            props = feature["properties"]
-            coords = feature["geometry"]["coordinates"]
-            
-            lat = coords[1]
-            lon = coords[0]
-            osm_id = props.get("osm_id")
-            osm_type_char = props.get("osm_type")
-            
-            # Map Photon type char to full name
-            type_map = {'R': 'relation', 'W': 'way', 'N': 'node'}
-            osm_type = type_map.get(osm_type_char, osm_type_char)
-            
-            return lat, lon, osm_id, osm_type
-        else:
-            print(f"Geocoding: No data found for {place_name}.")
-            return None
+        result = _parse_photon(response.json(), place_name)
     except Exception as e:
         print(f"Error fetching coordinates: {e}")
-        return None
+        metrics.AGENT_ERRORS.inc(agent="geocoding")
+        result = _FETCH_FAILED
+    _store_coordinates(key, result)
+    return None if result is _FETCH_FAILED else result
+
+
+async def _fetch_coordinates_async(key: str, place_name: str):
+    try:
+        response = await http_client.get_async(PHOTON_URL, params=_photon_params(place_name))
+        response.raise_for_status()
+        result = _parse_photon(response.json(), place_name)
+    except Exception as e:
+        print(f"Error fetching coordinates: {e}")
+        metrics.AGENT_ERRORS.inc(agent="geocoding")
+        result = _FETCH_FAILED
+    await _store_coordinates_async(key, result)
+    return None if result is _FETCH_FAILED else result
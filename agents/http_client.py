@@ -0,0 +1,296 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import defaultdict
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from agents import admission, circuit_breaker, deadline, metrics, rate_limit, recorder
+
+# Pool and retry configuration
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "10"))  # hosts kept per pool manager
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "20"))  # keep-alive connections per host
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.3"))  # base delay in seconds
+HTTP_MAX_BACKOFF = float(os.environ.get("HTTP_MAX_BACKOFF", "5"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Per-host timeouts in seconds; hosts not listed use DEFAULT_TIMEOUT
+DEFAULT_TIMEOUT = 10
+HOST_TIMEOUTS = {
+    "photon.komoot.io": 10,
+    "api.open-meteo.com": 10,
+    "overpass-api.de": 20,
+}
+
+_session = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+_lock = threading.Lock()
+_stats = defaultdict(lambda: {"requests": 0, "retries": 0, "errors": 0, "new_connections": 0})
+
+
+def host_timeout(url: str) -> float:
+    return HOST_TIMEOUTS.get(urlsplit(url).hostname, DEFAULT_TIMEOUT)
+
+
+def _count(host: str, name: str, amount: int = 1) -> None:
+    with _lock:
+        _stats[host][name] += amount
+
+
+def _finish(breaker: circuit_breaker.CircuitBreaker, host: str, start: float, outcome: str, failed: Optional[bool]) -> None:
+    """Records one attempt in the metrics, the host's counters and its circuit breaker."""
+    elapsed = time.perf_counter() - start
+    metrics.UPSTREAM_SECONDS.observe(elapsed, host=host, outcome=outcome)
+    if outcome in ("connect_error", "timeout", "error"):
+        _count(host, "errors")
+    breaker.record(elapsed, failed)
+
+
+def _timed_out(attempt_timeout: float, timeout: float) -> Optional[bool]:
+    """
+    How a timed-out attempt counts against the host: a failure if it had the host's
+    full timeout, inconclusive if the deadline had shortened it.
+    """
+    return True if attempt_timeout >= timeout else None
+
+
+def _time_left_for(delay: float) -> bool:
+    """Whether a retry after `delay` seconds would still start before the deadline."""
+    left = deadline.remaining()
+    return left is None or left > delay
+
+
+def _backoff_delay(attempt: int, response=None) -> float:
+    """Exponential backoff with full jitter; honours a numeric Retry-After header."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_MAX_BACKOFF)
+    return random.uniform(0, min(HTTP_BACKOFF * (2 ** attempt), HTTP_MAX_BACKOFF))
+
+
+def get_session() -> requests.Session:
+    """Returns the shared requests session with per-host keep-alive pools."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        limits = httpx.Limits(
+            max_connections=HTTP_POOL_MAXSIZE * HTTP_POOL_CONNECTIONS,
+            max_keepalive_connections=HTTP_POOL_MAXSIZE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        client = httpx.AsyncClient(limits=limits)
+        _async_clients[loop] = client
+    return client
+
+
+def request(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared session. Connection errors and 429/5xx
+    responses are retried with jittered backoff; the last response is returned as is.
+    Each attempt gets at most the time left before the request deadline, and hosts
+    whose circuit is open fail fast with CircuitOpenError. Upstreams registered with
+    admission.limit_upstream are called only with a free slot; UpstreamBusy is raised
+    if none frees up in time.
+    """
+    host = urlsplit(url).hostname
+    timeout = timeout or host_timeout(url)
+    session = get_session()
+    breaker = circuit_breaker.get_breaker(host)
+    limiter = admission.upstream_limiter(url)
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        rate_limit.acquire(host)
+        slot = limiter.acquire() if limiter is not None else None
+        try:
+            breaker.before_call()
+            try:
+                attempt_timeout = deadline.clamp(timeout)
+            except deadline.DeadlineExceeded:
+                breaker.record(0.0, None)
+                raise
+            _count(host, "requests")
+            start = time.perf_counter()
+            try:
+                with metrics.UPSTREAM_IN_FLIGHT.track_inprogress(host=host):
+                    response = session.request(method, url, timeout=attempt_timeout, **kwargs)
+            except requests.ConnectionError as e:
+                _finish(breaker, host, start, "connect_error", True)
+                response, error = None, e
+            except requests.Timeout:
+                _finish(breaker, host, start, "timeout", _timed_out(attempt_timeout, timeout))
+                raise
+            except Exception:
+                _finish(breaker, host, start, "error", None)
+                raise
+            else:
+                _finish(breaker, host, start, f"{response.status_code // 100}xx", response.status_code in RETRY_STATUSES)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+        finally:
+            if limiter is not None:
+                limiter.release(slot)
+
+        delay = _backoff_delay(attempt, response)
+        if attempt == HTTP_MAX_RETRIES or not _time_left_for(delay):
+            if response is None:
+                raise error
+            return response
+        if response is not None:
+            response.close()
+        _count(host, "retries")
+        metrics.UPSTREAM_RETRIES.inc(host=host, reason=str(response.status_code) if response is not None else "connect_error")
+        time.sleep(delay)
+
+
+async def request_async(method: str, url: str, timeout: Optional[float] = None, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Async counterpart of request, using the loop's pooled httpx client. With stream=True
+    the body is left unread, as with requests' stream=True; the caller must aclose() it.
+    """
+    host = urlsplit(url).hostname
+    timeout = timeout or host_timeout(url)
+    client = get_async_client()
+    breaker = circuit_breaker.get_breaker(host)
+    limiter = admission.upstream_limiter(url)
+
+    async def trace(event_name, info):
+        # Count real TCP handshakes; requests on kept-alive connections skip this event
+        if event_name == "connection.connect_tcp.complete":
+            _count(host, "new_connections")
+
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        slot = await limiter.acquire_async() if limiter is not None else None
+        try:
+            breaker.before_call()
+            try:
+                attempt_timeout = deadline.clamp(timeout)
+            except deadline.DeadlineExceeded:
+                breaker.record(0.0, None)
+                raise
+            _count(host, "requests")
+            start = time.perf_counter()
+            try:
+                with metrics.UPSTREAM_IN_FLIGHT.track_inprogress(host=host):
+                    outgoing = client.build_request(method, url, timeout=attempt_timeout, extensions={"trace": trace}, **kwargs)
+                    response = await client.send(outgoing, stream=stream)
+            except httpx.ConnectError as e:
+                _finish(breaker, host, start, "connect_error", True)
+                response, error = None, e
+            except httpx.TimeoutException:
+                _finish(breaker, host, start, "timeout", _timed_out(attempt_timeout, timeout))
+                raise
+            except asyncio.CancelledError:
+                # The caller stopped waiting; at the deadline that is as good as a timeout
+                left = deadline.remaining()
+                expired = left is not None and left <= 0
+                _finish(breaker, host, start, "cancelled", _timed_out(attempt_timeout, timeout) if expired else None)
+                raise
+            except Exception:
+                _finish(breaker, host, start, "error", None)
+                raise
+            else:
+                _finish(breaker, host, start, f"{response.status_code // 100}xx", response.status_code in RETRY_STATUSES)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+        finally:
+            if limiter is not None:
+                limiter.release(slot)
+
+        delay = _backoff_delay(attempt, response)
+        if attempt == HTTP_MAX_RETRIES or not _time_left_for(delay):
+            if response is None:
+                raise error
+            return response
+        if response is not None:
+            await response.aclose()
+        _count(host, "retries")
+        metrics.UPSTREAM_RETRIES.inc(host=host, reason=str(response.status_code) if response is not None else "connect_error")
+        await asyncio.sleep(delay)
+
+
+def _upstream_name(url: str) -> str:
+    limiter = admission.upstream_limiter(url)
+    return limiter.name if limiter is not None else urlsplit(url).hostname
+
+
+def _record(url: str, response: requests.Response) -> requests.Response:
+    """Logs the response when traffic recording is on; its body stays readable afterwards."""
+    if recorder.RECORD_TRAFFIC:
+        recorder.record_upstream(_upstream_name(url), response.request.method, response.url, response.request.body,
+                                 response.status_code, response.elapsed.total_seconds(), response.content)
+    return response
+
+
+async def _record_async(url: str, response: httpx.Response) -> httpx.Response:
+    if recorder.RECORD_TRAFFIC:
+        await response.aread()
+        recorder.record_upstream(_upstream_name(url), response.request.method, str(response.url), response.request.content,
+                                 response.status_code, response.elapsed.total_seconds(), response.content)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return _record(url, request("GET", url, **kwargs))
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return _record(url, request("POST", url, **kwargs))
+
+
+async def get_async(url: str, **kwargs) -> httpx.Response:
+    return await _record_async(url, await request_async("GET", url, **kwargs))
+
+
+async def post_async(url: str, **kwargs) -> httpx.Response:
+    return await _record_async(url, await request_async("POST", url, **kwargs))
+
+
+def get_stats() -> dict:
+    """
+    Per-host request, retry and connection counters. reused_connections is the
+    number of requests that skipped a TCP/TLS handshake thanks to keep-alive.
+    """
+    with _lock:
+        stats = {host: dict(values) for host, values in _stats.items()}
+
+    # Connections opened by the sync session's urllib3 pools
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host_stats = stats.setdefault(pool.host, {"requests": 0, "retries": 0, "errors": 0, "new_connections": 0})
+                host_stats["new_connections"] += pool.num_connections
+                host_stats["pool_maxsize"] = pool.pool.maxsize if pool.pool is not None else HTTP_POOL_MAXSIZE
+                host_stats["idle_connections"] = pool.pool.qsize() if pool.pool is not None else 0
+
+    for host_stats in stats.values():
+        host_stats["reused_connections"] = max(host_stats["requests"] - host_stats["new_connections"], 0)
+    return stats
@@ -0,0 +1,153 @@
+"""
+Incremental reading of one array inside a JSON object, for upstream responses
+where only the first few items matter. ArrayReader is fed raw body chunks and
+hands back each item of the array under `key` as soon as it is complete, so the
+caller can stop reading, and close the connection, without downloading or
+decoding the rest. Only the standard library json decoder is used.
+"""
+import codecs
+import json
+from typing import Any, AsyncIterator, Iterable, Iterator, List
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}"
+_NOTHING = object()
+
+
+class _NeedMore(Exception):
+    """The buffer ends before the next token is complete."""
+
+
+class ArrayReader:
+    """
+    Push parser for `{"...": ..., key: [item, item, ...], ...}`. Other top-level
+    members are decoded and dropped; a body without key yields nothing.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._eof = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        """Adds body bytes and returns the array items completed by them."""
+        self._buf = self._buf[self._pos:] + self._text.decode(chunk)
+        self._pos = 0
+        return self._drain()
+
+    def close(self) -> List[Any]:
+        """Marks the end of the body; raises ValueError if it was cut short."""
+        self._buf = self._buf[self._pos:] + self._text.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        items = self._drain()
+        if self._state != "done":
+            raise ValueError("Truncated JSON document")
+        return items
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def _drain(self) -> List[Any]:
+        items = []
+        while self._state != "done":
+            start = self._pos
+            try:
+                item = self._step()
+            except _NeedMore:
+                # Retry the whole token once more of the body has arrived
+                self._pos = start
+                break
+            if item is not _NOTHING:
+                items.append(item)
+        return items
+
+    def _step(self):
+        # Each call consumes one token, or raises _NeedMore having consumed nothing
+        char = self._peek()
+        if self._state == "start":
+            self._expect(char, "{")
+            self._state = "member"
+        elif self._state == "member":
+            if char == "}":
+                self._pos += 1
+                self._state = "done"
+            elif char == ",":
+                self._pos += 1
+            else:
+                name = self._value()
+                if not isinstance(name, str):
+                    raise ValueError("Expected an object key")
+                self._expect(self._peek(), ":")
+                self._state = "array" if name == self.key else "skip"
+        elif self._state == "skip":
+            self._value()
+            self._state = "member"
+        elif self._state == "array":
+            self._expect(char, "[")
+            self._state = "item"
+        elif self._state == "item":
+            if char == "]":
+                self._pos += 1
+                self._state = "member"
+            elif char == ",":
+                self._pos += 1
+            else:
+                return self._value()
+        return _NOTHING
+
+    def _peek(self) -> str:
+        while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+            self._pos += 1
+        if self._pos == len(self._buf):
+            if self._eof:
+                raise ValueError("Truncated JSON document")
+            raise _NeedMore
+        return self._buf[self._pos]
+
+    def _expect(self, char: str, wanted: str) -> None:
+        if char != wanted:
+            raise ValueError(f"Expected {wanted!r} at offset {self._pos}, found {char!r}")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+            raise _NeedMore
+        # A number or literal is only complete once a delimiter follows it: "0." may be "0.6"
+        if not isinstance(value, (dict, list, str)) and not self._eof:
+            if end == len(self._buf) or self._buf[end] not in _DELIMITERS:
+                raise _NeedMore
+        self._pos = end
+        return value
+
+
+def iter_items(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """Yields the items of the array under key while reading chunks."""
+    reader = ArrayReader(key)
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+        if reader.done:
+            return
+    yield from reader.close()
+
+
+async def aiter_items(chunks: AsyncIterator[bytes], key: str) -> AsyncIterator[Any]:
+    """Async counterpart of iter_items."""
+    reader = ArrayReader(key)
+    async for chunk in chunks:
+        for item in reader.feed(chunk):
+            yield item
+        if reader.done:
+            return
+    for item in reader.close():
+        yield item
@@ -0,0 +1,195 @@
+"""
+Minimal in-process metrics with Prometheus text exposition, plus per-request
+stage timings for the Server-Timing header.
+
+Metrics are per process; with several gunicorn workers each worker reports its own.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from cache hits up to the Overpass timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts, then sum and count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, state) -> List[str]:
+        bucket_counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        plain = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{plain} {total}")
+        lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Metrics used across the agents -------------------------------------------
+
+CHAT_REQUEST_SECONDS = Histogram("chat_request_seconds", "Time to answer a chat request.", ("endpoint", "status"))
+CHAT_IN_FLIGHT = Gauge("chat_requests_in_flight", "Chat requests being processed.", ("endpoint",))
+STAGE_SECONDS = Histogram("chat_stage_seconds", "Time spent in each ParentAgent stage.", ("stage",))
+UPSTREAM_SECONDS = Histogram("upstream_request_seconds", "Upstream HTTP call latency.", ("host", "outcome"))
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream HTTP calls in progress.", ("host",))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Upstream calls retried.", ("host", "reason"))
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by result.", ("cache", "result"))
+NEGATIVE_CACHE_HITS = Counter("negative_cache_hits_total", "Lookups answered by the negative cache.", ("kind",))
+LOCAL_INDEX_HITS = Counter("local_index_hits_total", "Lookups answered by an offline index.", ("index",))
+COALESCED_CALLS = Counter("coalesced_calls_total", "Calls that joined an in-flight identical call.", ("group",))
+FALLBACKS = Counter("fallbacks_total", "Fallback paths taken.", ("kind",))
+AGENT_ERRORS = Counter("agent_errors_total", "Agent calls that failed.", ("agent",))
+DEADLINE_MISSES = Counter("deadline_misses_total", "Reply parts dropped because the request deadline passed.", ("agent",))
+CIRCUIT_STATE = Gauge("circuit_state", "Upstream circuit state: 0 closed, 1 half-open, 2 open.", ("host",))
+ADMISSIONS = Counter("chat_admissions_total", "Chat requests by admission result.", ("result",))
+CHAT_QUEUED = Gauge("chat_requests_queued", "Chat requests waiting for a processing slot.")
+UPSTREAM_THROTTLED = Counter("upstream_throttled_total", "Upstream calls refused a slot by the upstream limiter.", ("upstream",))
+CIRCUIT_REJECTIONS = Counter("circuit_rejections_total", "Upstream calls failed fast by an open circuit.", ("host",))
+
+
+# --- Per-request stage timings --------------------------------------------------
+
+_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("timings", default=None)
+
+
+def start_timing() -> List[Tuple[str, float]]:
+    """Starts collecting stage timings for the current request and returns the list."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    """Times a ParentAgent stage into the histogram and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def server_timing(timings: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Formats timings as a Server-Timing header value (durations in ms)."""
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from typing import Optional
+from agents import metrics
+from agents.cache import LRUCache
+
+# How long each kind of negative result is trusted, in seconds
+NEGATIVE_TTLS = {
+    # Place names Photon could not resolve
+    "geocode": float(os.environ.get("GEOCODE_NEGATIVE_TTL", "3600")),  # 1 hour
+    # Overpass areas with no named POIs; OSM data for these changes slowly
+    "area": float(os.environ.get("EMPTY_AREA_TTL", str(7 * 24 * 3600))),  # 7 days
+}
+NEGATIVE_CACHE_SIZE = int(os.environ.get("NEGATIVE_CACHE_SIZE", "4096"))
+
+
+class NegativeCache:
+    """
+    Remembers lookups known to come back empty, with a TTL per kind,
+    so callers can skip doomed upstream calls.
+    """
+
+    def __init__(self, ttls: dict, maxsize: int = 4096):
+        self.ttls = dict(ttls)
+        self._entries = {kind: LRUCache(maxsize) for kind in self.ttls}
+        self._hits = {kind: 0 for kind in self.ttls}
+        self._lock = threading.Lock()
+
+    def add(self, kind: str, key, ttl: Optional[float] = None) -> None:
+        self._entries[kind].set(str(key), time.time(), ttl if ttl is not None else self.ttls[kind])
+
+    def contains(self, kind: str, key) -> bool:
+        if self._entries[kind].get(str(key)) is None:
+            return False
+        with self._lock:
+            self._hits[kind] += 1
+        metrics.NEGATIVE_CACHE_HITS.inc(kind=kind)
+        return True
+
+    def remove(self, kind: str, key) -> None:
+        self._entries[kind].delete(str(key))
+
+    def clear(self, kind: Optional[str] = None) -> None:
+        for name, entries in self._entries.items():
+            if kind is None or name == kind:
+                entries.clear()
+
+    def snapshot(self) -> dict:
+        """Contents and counters per kind, for the admin endpoint."""
+        now = time.time()
+        with self._lock:
+            hits = dict(self._hits)
+        snapshot = {}
+        for kind, entries in self._entries.items():
+            items = entries.items()
+            snapshot[kind] = {
+                "ttl": self.ttls[kind],
+                "hits": hits[kind],
+                "size": len(items),
+                "entries": [
+                    {"key": key, "added_at": added_at, "expires_in": round(expires_at - now, 1)}
+                    for key, added_at, expires_at in items
+                ],
+            }
+        return snapshot
+
+
+negative_cache = NegativeCache(NEGATIVE_TTLS, NEGATIVE_CACHE_SIZE)
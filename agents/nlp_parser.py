@@ -1,5 +1,14 @@
 import re
-from typing import Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional
+
+# Words that never start a location name
+QUESTION_STARTERS = {"What", "Tell", "Show", "Plan", "How", "Why", "When", "Where"}
+
+SENTENCE_STARTERS = {
+    "What", "Tell", "Show", "Plan", "How", "Why", "When", "Where",
+    "I", "We", "You", "They", "Can", "Could", "Would", "Should",
+    "Is", "Are", "Do", "Does", "Will", "Please"
+}
 
 class NLPParser:
     def __init__(self):
@@ -33,6 +42,27 @@ class NLPParser:
             "going", "vacation", "holiday", "things", "spots", "sites",
             "landmarks", "monuments", "museums", "parks"
         ]
+
+        self._compile()
+
+    def _compile(self):
+        """Build the lookup sets and regexes used on every message, once."""
+        trigger_words = "|".join(re.escape(w) for w in self.location_prepositions + self.location_verbs)
+        # The lookahead makes matches zero-width, so overlapping candidates are all seen
+        # and the first occurrence of every trigger word is found in a single scan.
+        self._cased_scanner = re.compile(rf'(?=\b({trigger_words})\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*))')
+        self._lower_scanner = re.compile(rf'(?=\b({trigger_words})\s+([a-z][a-z]+(?:\s+[a-z]+)*))')
+        self._prep_strip_words = set(self.location_verbs) | self.skip_words
+        self._keyword_set = set(self.weather_keywords) | set(self.places_keywords)
+        self._punctuation = re.compile(r'[^\w\s]')
+        # Substring matchers, equivalent to `any(keyword in text ...)`
+        self._weather_scanner = self._alternation(self.weather_keywords)
+        self._places_scanner = self._alternation(self.places_keywords)
+        self._any_keyword = self._alternation(self.weather_keywords + self.places_keywords)
+
+    @staticmethod
+    def _alternation(words):
+        return re.compile("|".join(re.escape(w) for w in words))
     
     def parse(self, user_input: str) -> Tuple[Optional[str], str]:
         """
@@ -48,75 +78,61 @@ class NLPParser:
         intent = self._determine_intent(user_input)
         
         return location, intent
+
+    def parse_many(self, user_inputs: Iterable[str]) -> List[Tuple[Optional[str], str]]:
+        """
+        Parse a batch of messages. Repeated messages are parsed once.
+        """
+        parsed = {}
+        results = []
+        for user_input in user_inputs:
+            result = parsed.get(user_input)
+            if result is None:
+                result = parsed[user_input] = self.parse(user_input)
+            results.append(result)
+        return results
     
     def _extract_location(self, text: str) -> Optional[str]:
         """Extract location from text using regex patterns and heuristics."""
+        # Trigger words (prepositions and verbs) are located in one scan of the text
+        # and one scan of its lowercase form, then tried in priority order.
+        text_lower = text.lower()
+        cased_matches = self._first_matches(self._cased_scanner, text)
+        lower_matches = self._first_matches(self._lower_scanner, text_lower)
         
         # Strategy 1: Look for patterns like "in <Location>", "to <Location>", etc.
         # This handles: "weather in Mumbai", "going to Kerala", "visit Delhi"
         for prep in self.location_prepositions:
             # Pattern: preposition followed by capitalized word(s)
-            pattern = rf'\b{prep}\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)'
-            match = re.search(pattern, text)
-            if match:
-                location = match.group(1).strip()
-                if self._is_valid_location(location):
-                    return location
+            location = self._cased_candidate(cased_matches, prep)
+            if location:
+                return location
             
             # Pattern: preposition followed by lowercase word (for all-lowercase input)
             # This handles: "going to bangalore", "weather in mumbai"
-            pattern_lower = rf'\b{prep}\s+([a-z][a-z]+(?:\s+[a-z]+)*)'
-            match = re.search(pattern_lower, text.lower())
-            if match:
-                raw_location = match.group(1).strip()
-                # Check if the first word is a verb or skip word (e.g. "to visit bangalore")
-                first_word = raw_location.split()[0]
-                if first_word in self.location_verbs or first_word in self.skip_words:
-                    # Strip the first word if there are more words
-                    parts = raw_location.split()
-                    if len(parts) > 1:
-                        raw_location = " ".join(parts[1:])
-                    else:
-                        continue
-                
-                location = raw_location.title()
-                if self._is_valid_location(location):
-                    return location
+            # A leading verb or skip word is stripped (e.g. "to visit bangalore")
+            location = self._lower_candidate(lower_matches, prep, self._prep_strip_words)
+            if location:
+                return location
         
         # Strategy 2: Look for patterns like "visit <Location>", "explore <Location>"
         for verb in self.location_verbs:
             # Pattern: verb followed by capitalized word(s)
-            pattern = rf'\b{verb}\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)'
-            match = re.search(pattern, text)
-            if match:
-                location = match.group(1).strip()
-                if self._is_valid_location(location):
-                    return location
+            location = self._cased_candidate(cased_matches, verb)
+            if location:
+                return location
             
-            # Pattern: verb followed by lowercase word
-            pattern_lower = rf'\b{verb}\s+([a-z][a-z]+(?:\s+[a-z]+)*)'
-            match = re.search(pattern_lower, text.lower())
-            if match:
-                raw_location = match.group(1).strip()
-                # Check if the first word is a skip word
-                first_word = raw_location.split()[0]
-                if first_word in self.skip_words:
-                    parts = raw_location.split()
-                    if len(parts) > 1:
-                        raw_location = " ".join(parts[1:])
-                    else:
-                        continue
-
-                location = raw_location.title()
-                if self._is_valid_location(location):
-                    return location
+            # Pattern: verb followed by lowercase word; a leading skip word is stripped
+            location = self._lower_candidate(lower_matches, verb, self.skip_words)
+            if location:
+                return location
         
         # Strategy 3: Look for capitalized words (proper nouns)
         # This handles: "What's the weather in Mumbai?"
         words = text.split()
         for i, word in enumerate(words):
             # Clean punctuation
-            clean_word = re.sub(r'[^\w\s]', '', word)
+            clean_word = self._punctuation.sub('', word)
             if clean_word and len(clean_word) > 2:
                 # Check if it's capitalized and not a skip word
                 if clean_word[0].isupper() and clean_word.lower() not in self.skip_words:
@@ -127,15 +143,50 @@ class NLPParser:
         
         # Strategy 4: Fallback - look for any word that could be a location
         # This handles fully lowercase queries: "bangalore weather"
-        words = text.lower().split()
+        words = text_lower.split()
         for word in words:
-            clean_word = re.sub(r'[^\w\s]', '', word)
+            clean_word = self._punctuation.sub('', word)
             if len(clean_word) > 2 and clean_word not in self.skip_words:
                 # Skip obvious non-location words
-                if not any(kw in clean_word for kw in self.weather_keywords + self.places_keywords):
+                if not self._any_keyword.search(clean_word):
                     return clean_word.title()
         
         return None
+
+    @staticmethod
+    def _first_matches(scanner, text: str) -> Dict[str, str]:
+        """Maps each trigger word to the words following its first occurrence."""
+        matches = {}
+        for match in scanner.finditer(text):
+            matches.setdefault(match.group(1), match.group(2))
+        return matches
+
+    def _cased_candidate(self, matches: Dict[str, str], word: str) -> Optional[str]:
+        location = matches.get(word)
+        if location:
+            location = location.strip()
+            if self._is_valid_location(location):
+                return location
+        return None
+
+    def _lower_candidate(self, matches: Dict[str, str], word: str, strip_words) -> Optional[str]:
+        raw_location = matches.get(word)
+        if not raw_location:
+            return None
+        raw_location = raw_location.strip()
+        # Check if the first word should be stripped
+        parts = raw_location.split()
+        if parts[0] in strip_words:
+            # Strip the first word if there are more words
+            if len(parts) > 1:
+                raw_location = " ".join(parts[1:])
+            else:
+                return None
+        
+        location = raw_location.title()
+        if self._is_valid_location(location):
+            return location
+        return None
     
     def _is_valid_location(self, word: str) -> bool:
         """Check if a word could be a valid location name."""
@@ -150,33 +201,28 @@ class NLPParser:
             return False
         
         # Skip if it's a weather or places keyword
-        if clean.lower() in self.weather_keywords or clean.lower() in self.places_keywords:
+        if clean.lower() in self._keyword_set:
             return False
         
         # Skip common sentence starters
-        if clean in ["What", "Tell", "Show", "Plan", "How", "Why", "When", "Where"]:
+        if clean in QUESTION_STARTERS:
             return False
         
         return True
     
     def _is_sentence_start_word(self, word: str) -> bool:
         """Check if a word is typically used at the start of sentences."""
-        sentence_starters = {
-            "What", "Tell", "Show", "Plan", "How", "Why", "When", "Where",
-            "I", "We", "You", "They", "Can", "Could", "Would", "Should",
-            "Is", "Are", "Do", "Does", "Will", "Please"
-        }
-        return word in sentence_starters
+        return word in SENTENCE_STARTERS
     
     def _determine_intent(self, text: str) -> str:
         """Determine user intent based on keywords."""
         text_lower = text.lower()
         
         # Check for weather keywords
-        has_weather = any(keyword in text_lower for keyword in self.weather_keywords)
+        has_weather = self._weather_scanner.search(text_lower) is not None
         
         # Check for places keywords
-        has_places = any(keyword in text_lower for keyword in self.places_keywords)
+        has_places = self._places_scanner.search(text_lower) is not None
         
         if has_weather and has_places:
             return "Both"
@@ -1,44 +1,355 @@
-from agents.geocoding import get_coordinates
-from agents.weather import get_weather
-from agents.places import get_places
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError, as_completed
+from typing import Iterator, List, Optional, Tuple
+from agents.geocoding import cached_coordinates, get_coordinates, get_coordinates_async
+from agents.weather import (get_current_weather, get_current_weather_async, get_current_weather_many,
+                            is_cached as weather_cached)
+from agents.places import find_places, find_places_async, is_cached as places_cached
 from agents.nlp_parser import NLPParser
+from agents.executor import submit
+from agents.deadline import BATCH_DEADLINE, CHAT_DEADLINE, remaining, scope
+from agents.response import (NO_LOCATION, NOT_FOUND, OK, TIMEOUT, Location, Place, Reply, cache_reply, cached_reply,
+                             has_reply, late_part, places_part, render, render_parts, unavailable_part, wanted_parts,
+                             weather_part)
+from agents import admission, metrics, warmer
+
+# Agent calls one batch keeps on the shared executor at a time, so a big batch leaves threads for /chat
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("BATCH_MAX_IN_FLIGHT", "4"))
+
+# Stands in for the result of an agent call that missed the deadline
+LATE = object()
+
+
+class _Plan:
+    """
+    One message worked out up to its agent calls: the steps every entry point shares.
+    reply is set as soon as the message is answered without the agents (no location,
+    a cached reply, a failed geocode); otherwise, once geocoded, calls lists the
+    (kind, args) agent calls to make, weather first.
+    """
+    __slots__ = ("location", "intent", "coords", "reply", "calls")
+
+    def __init__(self, location: Optional[str], intent: Optional[str]):
+        self.location = location
+        self.intent = intent
+        self.coords = None
+        self.reply: Optional[Reply] = None
+        self.calls: List[Tuple[str, tuple]] = []
+        if not location:
+            self.reply = Reply(NO_LOCATION)
+            return
+        # The same question about the same place was answered moments ago
+        cached = cached_reply(location, intent)
+        if cached is not None:
+            warmer.record(location)
+            self.reply = cached
+
+    def geocoded(self, coords) -> None:
+        """Takes the geocoding result: (lat, lon, osm_id, osm_type), None, or LATE."""
+        if coords is LATE or not coords:
+            status = TIMEOUT if coords is LATE or _expired() else NOT_FOUND
+            self.reply = Reply(status, Location(self.location), self.intent)
+            return
+        warmer.record(self.location)
+        self.coords = coords
+        lat, lon, osm_id, osm_type = coords
+        wants_weather, wants_places = wanted_parts(self.intent)
+        if wants_weather:
+            self.calls.append(("weather", (lat, lon)))
+        if wants_places:
+            self.calls.append(("places", (lat, lon, osm_id, osm_type)))
+
+    def finish(self, results: dict) -> Reply:
+        """The reply from the agent results by kind; cached when complete."""
+        self.reply = cache_reply(_build_reply(self.location, self.coords, self.intent, results))
+        return self.reply
+
+
+# Agent functions by part kind
+_AGENTS = {"weather": get_current_weather, "places": find_places}
+_ASYNC_AGENTS = {"weather": get_current_weather_async, "places": find_places_async}
+
 
 class ParentAgent:
-    def __init__(self):
-        """Initialize the parent agent with NLP parser."""
+    def __init__(self, concurrent: bool = True, deadline: Optional[float] = CHAT_DEADLINE,
+                 batch_deadline: Optional[float] = BATCH_DEADLINE):
+        """
+        Initialize the parent agent with NLP parser.
+        When concurrent is True, independent agent calls run in parallel on the shared executor.
+        deadline is the time budget in seconds for one message (None or 0 for no limit);
+        agent calls get whatever is left of it, and replies keep the parts that finished.
+        batch_deadline is the budget for a whole process_batch call, in the same way.
+        """
         self.parser = NLPParser()
+        self.concurrent = concurrent
+        self.deadline = deadline
+        self.batch_deadline = batch_deadline
 
-    def process_message(self, user_input: str) -> str:
+    def _run_agents(self, calls, max_in_flight: Optional[int] = None):
         """
-        Orchestrates the request using regex-based NLP for intent parsing.
+        Runs (function, args) pairs and returns their results in the same order.
+        Calls still running when the deadline passes are returned as LATE. With
+        max_in_flight, at most that many calls are on the shared executor at a time.
         """
-        # 1. Parse Intent and Location with NLP
-        location, intent = self.parser.parse(user_input)
-        
-        if not location:
-            return "I couldn't identify the location you want to visit. Please specify a city."
+        if not self.concurrent or len(calls) < 2:
+            return [_late_if_expired(func(*args)) for func, args in calls]
+
+        slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        futures = []
+        for func, args in calls:
+            # Calls that cannot even start before the deadline are LATE
+            if slots is not None and not slots.acquire(timeout=_wait_timeout()):
+                futures.append(None)
+                continue
+            future = submit(func, *args)
+            if slots is not None:
+                future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
 
-        # 2. Get Coordinates
-        coords = get_coordinates(location)
+        results = []
+        for (func, _), future in zip(calls, futures):
+            if future is None:
+                metrics.DEADLINE_MISSES.inc(agent=func.__name__)
+                results.append(LATE)
+                continue
+            try:
+                results.append(_late_if_expired(future.result(timeout=_wait_timeout())))
+            except TimeoutError:
+                metrics.DEADLINE_MISSES.inc(agent=func.__name__)
+                results.append(LATE)
+        return results
+
+    def can_serve_from_cache(self, user_input: str) -> bool:
+        """
+        Whether a reply needs no upstream call: the message names no location, or
+        everything it asks for is in the local indexes or the caches. Only peeks.
+        """
+        location, intent = self.parser.parse(user_input)
+        if not location or has_reply(location, intent):
+            return True
+        coords = cached_coordinates(location)
         if not coords:
-            return f"I couldn't find the location '{location}'. Please check the spelling or try a major city."
-        
+            return False
         lat, lon, osm_id, osm_type = coords
-        
-        # 3. Call Agents based on Intent
-        response_parts = []
-        
-        if intent == "Weather" or intent == "Both":
-            weather_info = get_weather(lat, lon)
-            if weather_info:
-                response_parts.append(f"In {location} it's {weather_info}.")
-        
-        if intent == "Places" or intent == "Both":
-            places = get_places(lat, lon, osm_id, osm_type)
-            if places:
-                places_list = "\n".join(places)
-                response_parts.append(f"In {location} these are the places you can go:\n{places_list}")
-            else:
-                response_parts.append(f"I couldn't find any specific tourist attractions in {location}.")
-
-        return "\n\n".join(response_parts)
+        wants_weather, wants_places = wanted_parts(intent)
+        return ((not wants_weather or weather_cached(lat, lon))
+                and (not wants_places or places_cached(lat, lon, osm_id, osm_type)))
+
+    def _parse(self, user_input: str) -> _Plan:
+        # 1. Parse Intent and Location with NLP
+        with metrics.stage("parse"):
+            location, intent = self.parser.parse(user_input)
+        return _Plan(location, intent)
+
+    def _plan(self, user_input: str) -> _Plan:
+        """Parses and geocodes one message on this thread."""
+        plan = self._parse(user_input)
+        if plan.reply is None:
+            # 2. Get Coordinates
+            with metrics.stage("geocode"):
+                coords = get_coordinates(plan.location)
+            plan.geocoded(coords)
+        return plan
+
+    def process_message(self, user_input: str) -> str:
+        """
+        Orchestrates the request using regex-based NLP for intent parsing.
+        """
+        return render(self.answer(user_input))
+
+    def answer(self, user_input: str) -> Reply:
+        """Like process_message, but returns the structured reply; see agents.response."""
+        with scope(self.deadline):
+            plan = self._plan(user_input)
+            if plan.reply is not None:
+                return plan.reply
+
+            # 3. Call Agents based on Intent (concurrently when both are needed)
+            results = self._run_agents([(_staged(kind, _AGENTS[kind]), args) for kind, args in plan.calls])
+            return plan.finish({kind: result for (kind, _), result in zip(plan.calls, results)})
+
+    def stream_message(self, user_input: str) -> Iterator[str]:
+        """
+        Like process_message, but yields each reply part as soon as its agent finishes,
+        so the weather line can be sent while places are still loading.
+        """
+        # The deadline scope must not stay open across yields, so everything up to
+        # starting the agent calls happens first and only the waiting is left
+        with scope(self.deadline):
+            plan = self._plan(user_input)
+            pending = {submit(_staged(kind, _AGENTS[kind]), *args): kind for kind, args in plan.calls}
+            timeout = _wait_timeout()
+        if plan.reply is not None:
+            yield from render_parts(plan.reply)
+            return
+
+        # Outside the scope the deadline is gone, so results are checked against this
+        ends_at = None if timeout is None else time.monotonic() + timeout
+        results = {}
+        try:
+            for future in as_completed(pending, timeout=timeout):
+                kind = pending.pop(future)
+                results[kind] = _late_if_expired(future.result(), ends_at)
+                part = _part(plan.location, kind, results[kind])
+                if part:
+                    yield part
+        except TimeoutError:
+            for kind in pending.values():
+                metrics.DEADLINE_MISSES.inc(agent=_AGENTS[kind].__name__)
+                results[kind] = LATE
+                yield late_part(plan.location, kind)
+        plan.finish(results)
+
+    def process_batch(self, user_inputs: List[str]) -> List[str]:
+        """
+        Processes many messages at once and returns the replies in input order.
+        Each unique location is geocoded once and each unique place is fetched once,
+        in parallel; weather for all of them goes out as one batched request.
+        The batch runs under batch_deadline, not the per-message deadline, and as
+        background work, so it waits for upstream slots without taking the ones
+        kept for /chat.
+        """
+        with scope(self.batch_deadline), admission.background():
+            with metrics.stage("parse"):
+                parsed = self.parser.parse_many(user_inputs)
+            plans = {key: _Plan(*key) for key in dict.fromkeys(parsed)}
+            todo = [plan for plan in plans.values() if plan.reply is None]
+
+            # 1. Geocode every distinct location once
+            locations = list(dict.fromkeys(plan.location for plan in todo))
+            calls = [(get_coordinates, (location,)) for location in locations]
+            with metrics.stage("geocode"):
+                geocoded = dict(zip(locations, self._run_agents(calls, BATCH_MAX_IN_FLIGHT)))
+            for plan in todo:
+                plan.geocoded(geocoded[plan.location])
+
+            # 2. Spellings that geocode to the same place share one fetch
+            wanted = {"weather": {}, "places": {}}
+            for plan in todo:
+                for kind, args in plan.calls:
+                    wanted[kind][args] = None
+
+            # 3. Fetch them
+            with metrics.stage("weather"):
+                weather = dict(zip(wanted["weather"], get_current_weather_many(list(wanted["weather"]))))
+            calls = [(find_places, args) for args in wanted["places"]]
+            with metrics.stage("places"):
+                places = dict(zip(wanted["places"], self._run_agents(calls, BATCH_MAX_IN_FLIGHT)))
+            fetched = {"weather": weather, "places": places}
+            for plan in todo:
+                if plan.reply is None:
+                    plan.finish({kind: _late_if_expired(fetched[kind][args]) for kind, args in plan.calls})
+
+        # 4. Render one reply per distinct (location, intent), in input order
+        rendered = {key: render(plan.reply) for key, plan in plans.items()}
+        return [rendered[key] for key in parsed]
+
+    async def process_message_async(self, user_input: str) -> str:
+        """
+        Async counterpart of process_message. Agent calls for one message run
+        concurrently on the current event loop.
+        """
+        return render(await self.answer_async(user_input))
+
+    async def answer_async(self, user_input: str) -> Reply:
+        """Async counterpart of answer."""
+        with scope(self.deadline):
+            plan = self._parse(user_input)
+            if plan.reply is None:
+                with metrics.stage("geocode"):
+                    try:
+                        coords = await asyncio.wait_for(get_coordinates_async(plan.location), _wait_timeout())
+                    except asyncio.TimeoutError:
+                        metrics.DEADLINE_MISSES.inc(agent="get_coordinates")
+                        coords = LATE
+                plan.geocoded(coords)
+            if plan.reply is not None:
+                return plan.reply
+
+            tasks = {kind: asyncio.ensure_future(_staged_async(kind, _ASYNC_AGENTS[kind](*args))) for kind, args in plan.calls}
+            await asyncio.wait(tasks.values(), timeout=_wait_timeout())
+
+            results = {}
+            for kind, task in tasks.items():
+                if task.done():
+                    results[kind] = _late_if_expired(task.result())
+                else:
+                    task.cancel()
+                    metrics.DEADLINE_MISSES.inc(agent=_AGENTS[kind].__name__)
+                    results[kind] = LATE
+            return plan.finish(results)
+
+
+def _wait_timeout() -> Optional[float]:
+    """How long to wait for agent calls under the current deadline; None without one."""
+    left = remaining()
+    return None if left is None else max(left, 0)
+
+
+def _expired(ends_at: Optional[float] = None) -> bool:
+    """Whether the current deadline, or ends_at (a time.monotonic() value) when given, has passed."""
+    if ends_at is not None:
+        return time.monotonic() >= ends_at
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def _late_if_expired(result, ends_at: Optional[float] = None):
+    """An empty result that arrives after the deadline most likely timed out; report it as LATE."""
+    return LATE if not result and _expired(ends_at) else result
+
+
+def _staged(name: str, func):
+    """Wraps an agent call so its duration is recorded as a ParentAgent stage."""
+    @functools.wraps(func)
+    def run(*args):
+        with metrics.stage(name):
+            return func(*args)
+    return run
+
+
+async def _staged_async(name: str, coro):
+    with metrics.stage(name):
+        return await coro
+
+
+def _places(names: List[str]) -> Tuple[Place, ...]:
+    return tuple(Place(name) for name in names)
+
+
+def _part(location: str, kind: str, result) -> Optional[str]:
+    """Renders one streamed part from its agent result."""
+    if result is LATE:
+        return late_part(location, kind)
+    if result is None:
+        return unavailable_part(location, kind)
+    if kind == "weather":
+        return weather_part(location, result)
+    return places_part(location, _places(result))
+
+
+def _build_reply(location: str, coords, intent: str, results: dict) -> Reply:
+    """
+    Builds the reply from the agent results by part kind ("weather", "places"), for
+    the parts the intent asks for. LATE results are listed in reply.late, and None,
+    from an agent whose upstream failed, in reply.unavailable.
+    """
+    found, late, unavailable = {}, [], []
+    for kind in ("weather", "places"):
+        if kind not in results:
+            continue
+        result = results[kind]
+        if result is LATE:
+            late.append(kind)
+        elif result is None:
+            unavailable.append(kind)
+        else:
+            found[kind] = result
+    places = _places(found["places"]) if "places" in found else None
+    lat, lon, osm_id, osm_type = coords
+    return Reply(OK, Location(location, lat, lon, osm_id, osm_type), intent, found.get("weather"), places,
+                 tuple(late), tuple(unavailable))
@@ -1,184 +1,259 @@
-import requests
-from typing import List, Optional
+import os
+import time
+from typing import Iterable, List, Optional
+from agents import admission, http_client, json_stream, metrics, poi_index
+from agents.cache import open_cache
+from agents.negative_cache import negative_cache
+from agents.singleflight import SingleFlight
 
-def get_places(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> List[str]:
-    """
-    Fetches tourist attractions near the given coordinates or within a specific area using Overpass API.
-    If osm_id and osm_type are provided, it attempts to search within that area.
-    Otherwise, it falls back to a radius search (default 5km).
-    """
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    area_id = None
+OVERPASS_URL = os.environ.get("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+# The public Overpass instance allows a couple of concurrent queries per client; these are per worker process
+OVERPASS_MAX_IN_FLIGHT = int(os.environ.get("OVERPASS_MAX_IN_FLIGHT", "2"))
+OVERPASS_RATE = float(os.environ.get("OVERPASS_RATE", "2"))  # calls per second, 0 for no limit
+
+admission.limit_upstream("overpass", OVERPASS_URL, OVERPASS_MAX_IN_FLIGHT, OVERPASS_RATE, burst=OVERPASS_MAX_IN_FLIGHT)
+MAX_PLACES = 10
+# Overpass bodies are read in chunks of this many bytes and abandoned once MAX_PLACES names are in
+OVERPASS_CHUNK_SIZE = int(os.environ.get("OVERPASS_CHUNK_SIZE", "16384"))
+
+# POI cache configuration
+POI_CACHE_SIZE = int(os.environ.get("POI_CACHE_SIZE", "1024"))
+POI_CACHE_TTL = float(os.environ.get("POI_CACHE_TTL", str(24 * 3600)))  # 1 day
+
+_cache = open_cache("places", POI_CACHE_SIZE)
+
+# Concurrent searches for the same area/point share one Overpass call
+_flight = SingleFlight("places")
+
+# Tourist POIs we search for, as Overpass filters
+_POI_FILTERS = [
+    'node["tourism"="attraction"]',
+    'way["tourism"="attraction"]',
+    'relation["tourism"="attraction"]',
+    'node["leisure"="park"]',
+]
+
+
+def _area_id(osm_id: Optional[int], osm_type: Optional[str]) -> Optional[int]:
+    """Converts an OSM relation/way id to its Overpass area id."""
     if osm_id and osm_type:
         if osm_type == 'relation':
-            area_id = osm_id + 3600000000
+            return osm_id + 3600000000
         elif osm_type == 'way':
-            area_id = osm_id + 2400000000
-            
+            return osm_id + 2400000000
+    return None
+
+
+def _poi_union(scope: str, name: str) -> str:
+    """Overpass union of all POI filters within scope, stored in set name."""
+    lines = "".join(f"  {poi_filter}({scope});\n" for poi_filter in _POI_FILTERS)
+    return f"(\n{lines})->.{name};\n"
+
+
+def build_overpass_query(lat: float, lon: float, area_id: Optional[int] = None, radius: int = 5000) -> str:
+    """
+    Builds one Overpass query for the POIs of an area and/or a radius around a point.
+    With an area, both result sets are requested in the same round trip; each set is
+    preceded by an `out count` element so the client can tell them apart. The area
+    set is printed before the radius search is even built, so closing the response
+    once the area results are read spares the server that search too.
+    """
+    query = "[out:json][timeout:20];\n"
+    if area_id:
+        query += f"area({area_id})->.searchArea;\n"
+        query += _poi_union("area.searchArea", "inArea")
+        query += f".inArea out count;\n.inArea out center {MAX_PLACES};\n"
+    query += _poi_union(f"around:{radius},{lat},{lon}", "nearby")
     if area_id:
-        # Search within the area
-        overpass_query = f"""
-        [out:json];
-        area({area_id})->.searchArea;
-        (
-          node["tourism"="attraction"](area.searchArea);
-          way["tourism"="attraction"](area.searchArea);
-          relation["tourism"="attraction"](area.searchArea);
-          node["leisure"="park"](area.searchArea);
-        );
-        out center 10;
-        """
-    else:
-        # Fallback to radius search
-        overpass_query = f"""
-        [out:json];
-        (
-          node["tourism"="attraction"](around:{radius},{lat},{lon});
-          way["tourism"="attraction"](around:{radius},{lat},{lon});
-          relation["tourism"="attraction"](around:{radius},{lat},{lon});
-          node["leisure"="park"](around:{radius},{lat},{lon});
-        );
-        out center 10;
-        """
+        query += ".nearby out count;\n"
+    query += f".nearby out center {MAX_PLACES};\n"
+    return query
+
+
+class _PlaceCollector:
+    """
+    Reads unique, cleaned place names from Overpass elements as they arrive. Area results
+    win; the radius results that follow them are only used when the area set is empty,
+    in which case the area is remembered as empty. add() returns True once no more
+    elements are needed: MAX_PLACES names are collected or the area set had some.
+    """
+
+    def __init__(self, area_id: Optional[int]):
+        self.area_id = area_id
+        self.places: List[str] = []
+        self._seen = set()
+        self._result_sets = 0
+
+    def add(self, element: dict) -> bool:
+        if element.get("type") == "count":
+            self._result_sets += 1
+            # Entering the radius set: only needed if the area set gave nothing
+            if self._result_sets == 2:
+                if self.places:
+                    return True
+                print(f"Area search for ID {self.area_id} returned no results. Falling back to radius search.")
+                negative_cache.add("area", self.area_id)
+                metrics.FALLBACKS.inc(kind="overpass_radius")
+            return False
+
+        tags = element.get("tags", {})
+        # Prefer English name, fallback to local name
+        name = tags.get("name:en", tags.get("name"))
+        if name:
+            # Clean up name: Title case and remove extra whitespace
+            clean_name = name.strip().title()
+            if clean_name not in self._seen:
+                self._seen.add(clean_name)
+                self.places.append(clean_name)
+        return len(self.places) >= MAX_PLACES
+
+
+def _collect_places(elements: Iterable[dict], area_id: Optional[int]) -> List[str]:
+    """Place names from Overpass elements; stops consuming them as soon as it has enough."""
+    collector = _PlaceCollector(area_id)
+    for element in elements:
+        if collector.add(element):
+            break
+    return collector.places
+
+
+def _search_area(osm_id: Optional[int], osm_type: Optional[str]) -> Optional[int]:
+    """The area to search, or None when it is unknown or known to have no POIs."""
+    area_id = _area_id(osm_id, osm_type)
+    if area_id and negative_cache.contains("area", area_id):
+        return None
+    return area_id
+
+
+def _cache_key(lat: float, lon: float, area_id: Optional[int], radius: int) -> str:
+    if area_id:
+        return f"area:{area_id}:{radius}"
+    # ~100 m grid, so nearby geocodes of the same city share an entry
+    return f"radius:{round(lat, 3)}:{round(lon, 3)}:{radius}"
 
-    try:
-        response = requests.post(overpass_url, data=overpass_query, timeout=20)
-        response.raise_for_status()
-        data = response.json()
-        
-        places = []
-        for element in data.get("elements", []):
-            tags = element.get("tags", {})
-            # Prefer English name, fallback to local name
-            name = tags.get("name:en", tags.get("name"))
-            if name:
-                # Clean up name: Title case and remove extra whitespace
-                clean_name = name.strip().title()
-                # Simple filter: Skip if name seems to be purely non-ASCII (optional, but user asked for English)
-                # For now, relying on name:en is usually enough, but let's ensure we don't get duplicates
-                if clean_name not in places:
-                    places.append(clean_name)
-        
-        # If area search yielded no results, try radius search
-        if not places and area_id:
-            print(f"Area search for ID {area_id} returned no results. Falling back to radius search.")
-            # Fallback to radius search
-            overpass_query = f"""
-            [out:json];
-            (
-              node["tourism"="attraction"](around:{radius},{lat},{lon});
-              way["tourism"="attraction"](around:{radius},{lat},{lon});
-              relation["tourism"="attraction"](around:{radius},{lat},{lon});
-              node["leisure"="park"](around:{radius},{lat},{lon});
-            );
-            out center 10;
-            """
-            response = requests.post(overpass_url, data=overpass_query, timeout=20)
-            response.raise_for_status()
-            data = response.json()
-            
-            for element in data.get("elements", []):
-                tags = element.get("tags", {})
-                name = tags.get("name:en", tags.get("name"))
-                if name:
-                    clean_name = name.strip().title()
-                    if clean_name not in places:
-                        places.append(clean_name)
-
-        return places[:10] # Return top 10
-    except Exception as e:
-        print(f"Error fetching places: {e}")
-        return []
-import requests
-from typing import List, Optional
 
 def get_places(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> List[str]:
     """
     Fetches tourist attractions near the given coordinates or within a specific area using Overpass API.
-    If osm_id and osm_type are provided, it attempts to search within that area.
-    Otherwise, it falls back to a radius search (default 5km).
+    If osm_id and osm_type are provided, it searches within that area and falls back to a
+    radius search (default 5km) in the same request. Areas known to be empty go straight
+    to the radius search. Regions in the local POI index are answered in-process, and
+    Overpass results are cached. Returns [] when Overpass could not be asked.
     """
-    overpass_url = "https://overpass-api.de/api/interpreter"
-    
-    area_id = None
-    if osm_id and osm_type:
-        if osm_type == 'relation':
-            area_id = osm_id + 3600000000
-        elif osm_type == 'way':
-            area_id = osm_id + 2400000000
-            
-    if area_id:
-        # Search within the area
-        overpass_query = f"""
-        [out:json];
-        area({area_id})->.searchArea;
-        (
-          node["tourism"="attraction"](area.searchArea);
-          way["tourism"="attraction"](area.searchArea);
-          relation["tourism"="attraction"](area.searchArea);
-          node["leisure"="park"](area.searchArea);
-        );
-        out center 10;
-        """
-    else:
-        # Fallback to radius search
-        overpass_query = f"""
-        [out:json];
-        (
-          node["tourism"="attraction"](around:{radius},{lat},{lon});
-          way["tourism"="attraction"](around:{radius},{lat},{lon});
-          relation["tourism"="attraction"](around:{radius},{lat},{lon});
-          node["leisure"="park"](around:{radius},{lat},{lon});
-        );
-        out center 10;
-        """
+    places = find_places(lat, lon, osm_id, osm_type, radius)
+    return places if places is not None else []
+
+
+def find_places(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> Optional[List[str]]:
+    """
+    Like get_places, but returns None instead of [] when Overpass failed or its circuit
+    is open, so a reply can say places are unavailable rather than that there are none.
+    """
+    area_id = _search_area(osm_id, osm_type)
+    # Regions covered by the local POI index never reach Overpass
+    local = poi_index.lookup(lat, lon, area_id, radius, MAX_PLACES)
+    if local is not None:
+        metrics.LOCAL_INDEX_HITS.inc(index="poi")
+        return local
+
+    key = _cache_key(lat, lon, area_id, radius)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
 
+    return _flight.do(key, _fetch_places, key, lat, lon, area_id, radius)
+
+
+def is_cached(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> bool:
+    """Whether the places for a location can be served without calling Overpass."""
+    area_id = _search_area(osm_id, osm_type)
+    if poi_index.lookup(lat, lon, area_id, radius, MAX_PLACES) is not None:
+        return True
+    return _cache.expires_at(_cache_key(lat, lon, area_id, radius)) is not None
+
+
+def warm_places(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None,
+                radius: int = 5000, refresh_ahead: float = 0) -> None:
+    """
+    For the cache warmer: fetches the places for a location unless they are cached
+    for more than refresh_ahead seconds or covered by the local POI index.
+    """
+    area_id = _search_area(osm_id, osm_type)
+    if poi_index.lookup(lat, lon, area_id, radius, MAX_PLACES) is not None:
+        return
+    key = _cache_key(lat, lon, area_id, radius)
+    expires_at = _cache.expires_at(key)
+    if expires_at is None or expires_at - time.time() <= refresh_ahead:
+        _flight.do(key, _fetch_places, key, lat, lon, area_id, radius)
+
+
+async def get_places_async(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> List[str]:
+    """
+    Async counterpart of get_places; shares its cache.
+    """
+    places = await find_places_async(lat, lon, osm_id, osm_type, radius)
+    return places if places is not None else []
+
+
+async def find_places_async(lat: float, lon: float, osm_id: Optional[int] = None, osm_type: Optional[str] = None, radius: int = 5000) -> Optional[List[str]]:
+    """Async counterpart of find_places."""
+    area_id = _search_area(osm_id, osm_type)
+    # Regions covered by the local POI index never reach Overpass
+    local = poi_index.lookup(lat, lon, area_id, radius, MAX_PLACES)
+    if local is not None:
+        metrics.LOCAL_INDEX_HITS.inc(index="poi")
+        return local
+
+    key = _cache_key(lat, lon, area_id, radius)
+    cached = await _cache.get_async(key)
+    if cached is not None:
+        return cached
+
+    return await _flight.do_async(key, _fetch_places_async, key, lat, lon, area_id, radius)
+
+
+def _fetch_places(key: str, lat: float, lon: float, area_id: Optional[int], radius: int) -> Optional[List[str]]:
+    """Queries Overpass and caches non-empty results under key. Returns None on error."""
     try:
-        response = requests.post(overpass_url, data=overpass_query, timeout=20)
-        response.raise_for_status()
-        data = response.json()
-        
-        places = []
-        for element in data.get("elements", []):
-            tags = element.get("tags", {})
-            # Prefer English name, fallback to local name
-            name = tags.get("name:en", tags.get("name"))
-            if name:
-                # Clean up name: Title case and remove extra whitespace
-                clean_name = name.strip().title()
-                # Simple filter: Skip if name seems to be purely non-ASCII (optional, but user asked for English)
-                # For now, relying on name:en is usually enough, but let's ensure we don't get duplicates
-                if clean_name not in places:
-                    places.append(clean_name)
-        
-        # If area search yielded no results, try radius search
-        if not places and area_id:
-            print(f"Area search for ID {area_id} returned no results. Falling back to radius search.")
-            # Fallback to radius search
-            overpass_query = f"""
-            [out:json];
-            (
-              node["tourism"="attraction"](around:{radius},{lat},{lon});
-              way["tourism"="attraction"](around:{radius},{lat},{lon});
-              relation["tourism"="attraction"](around:{radius},{lat},{lon});
-              node["leisure"="park"](around:{radius},{lat},{lon});
-            );
-            out center 10;
-            """
-            response = requests.post(overpass_url, data=overpass_query, timeout=20)
+        response = http_client.post(OVERPASS_URL, data=build_overpass_query(lat, lon, area_id, radius), stream=True)
+        try:
             response.raise_for_status()
-            data = response.json()
-            
-            for element in data.get("elements", []):
-                tags = element.get("tags", {})
-                name = tags.get("name:en", tags.get("name"))
-                if name:
-                    clean_name = name.strip().title()
-                    if clean_name not in places:
-                        places.append(clean_name)
-
-        return places[:10] # Return top 10
+            places = _collect_places(json_stream.iter_items(response.iter_content(OVERPASS_CHUNK_SIZE), "elements"), area_id)
+        finally:
+            # Drops the connection if the rest of the body was not read; a fully read one is kept alive
+            response.close()
     except Exception as e:
         print(f"Error fetching places: {e}")
-        return []
+        metrics.AGENT_ERRORS.inc(agent="places")
+        return None
+
+    if places:
+        _cache.set(key, places, POI_CACHE_TTL)
+    return places
+
+
+async def _fetch_places_async(key: str, lat: float, lon: float, area_id: Optional[int], radius: int) -> Optional[List[str]]:
+    try:
+        response = await http_client.post_async(OVERPASS_URL, content=build_overpass_query(lat, lon, area_id, radius), stream=True)
+        try:
+            response.raise_for_status()
+            collector = _PlaceCollector(area_id)
+            async for element in json_stream.aiter_items(response.aiter_bytes(OVERPASS_CHUNK_SIZE), "elements"):
+                if collector.add(element):
+                    break
+            places = collector.places
+        finally:
+            await response.aclose()
+    except Exception as e:
+        print(f"Error fetching places: {e}")
+        metrics.AGENT_ERRORS.inc(agent="places")
+        return None
+
+    if places:
+        await _cache.set_async(key, places, POI_CACHE_TTL)
+    return places
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the POI cache."""
+    return _cache.stats()
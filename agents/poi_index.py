@@ -0,0 +1,234 @@
+"""
+In-process spatial index of tourist POIs for our top destinations, so get_places
+can answer radius and area queries without calling Overpass.
+
+POI_INDEX_PATH points at a JSON extract, or a directory of them:
+
+    {"regions": [
+        {"name": "Goa",
+         "area_id": 3600000007,                     # optional, Overpass area id
+         "bbox": [south, west, north, east],        # coverage of this extract
+         "elements": [...]}                         # Overpass `out center` elements
+    ]}
+
+Elements use the Overpass JSON shape (tags plus lat/lon or center), so an extract
+can be produced by saving Overpass output for the region. Files are re-read when
+their modification time changes; unchanged files are not parsed again, and the
+new index is swapped in atomically without a restart.
+"""
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+_DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "poi")
+POI_INDEX_PATH = os.environ.get("POI_INDEX_PATH", _DEFAULT_PATH)
+POI_INDEX_CHECK_INTERVAL = float(os.environ.get("POI_INDEX_CHECK_INTERVAL", "60"))  # seconds between mtime checks
+
+# Grid cell size in degrees (~5.5 km of latitude)
+CELL_DEG = 0.05
+EARTH_RADIUS_M = 6371000.0
+
+
+def _element_name(element: dict) -> Optional[str]:
+    tags = element.get("tags", {})
+    # Prefer English name, fallback to local name; cleaned like Overpass results
+    name = tags.get("name:en", tags.get("name"))
+    return name.strip().title() if name else None
+
+
+def _element_coords(element: dict) -> Optional[Tuple[float, float]]:
+    if "lat" in element and "lon" in element:
+        return element["lat"], element["lon"]
+    center = element.get("center")
+    if center:
+        return center["lat"], center["lon"]
+    return None
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    return int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG))
+
+
+def _distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Equirectangular approximation; accurate to well under 1% at city scale."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+class PoiIndex:
+    """
+    Immutable grid index over POI coordinates, stored in flat arrays.
+    Build a new instance to change its contents.
+    """
+
+    def __init__(self, regions: List[dict]):
+        self.lats = array("d")
+        self.lons = array("d")
+        self.names: List[str] = []
+        self._grid: Dict[Tuple[int, int], array] = defaultdict(lambda: array("I"))
+        self._areas: Dict[int, List[str]] = {}
+        self._bboxes: List[Tuple[float, float, float, float]] = []
+
+        for region in regions:
+            area_names, seen = [], set()
+            for element in region.get("elements", []):
+                name = _element_name(element)
+                coords = _element_coords(element)
+                if not name or coords is None:
+                    continue
+                index = len(self.names)
+                self.names.append(name)
+                self.lats.append(coords[0])
+                self.lons.append(coords[1])
+                self._grid[_cell(*coords)].append(index)
+                if name not in seen:
+                    seen.add(name)
+                    area_names.append(name)
+            if region.get("area_id"):
+                self._areas[int(region["area_id"])] = area_names
+            if region.get("bbox"):
+                self._bboxes.append(tuple(region["bbox"]))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def covers(self, lat: float, lon: float, radius: float) -> bool:
+        """True if the whole search circle lies inside a loaded region."""
+        dlat = math.degrees(radius / EARTH_RADIUS_M)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        return any(
+            south <= lat - dlat and lat + dlat <= north and west <= lon - dlon and lon + dlon <= east
+            for south, west, north, east in self._bboxes
+        )
+
+    def area(self, area_id: int) -> Optional[List[str]]:
+        """Unique POI names loaded for an Overpass area id, or None if not loaded."""
+        return self._areas.get(area_id)
+
+    def radius(self, lat: float, lon: float, radius: float, limit: int = 10) -> List[str]:
+        """Unique POI names within radius metres, nearest first."""
+        dlat = math.degrees(radius / EARTH_RADIUS_M)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        min_x, min_y = _cell(lat - dlat, lon - dlon)
+        max_x, max_y = _cell(lat + dlat, lon + dlon)
+
+        hits = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                for index in self._grid.get((x, y), ()):
+                    distance = _distance_m(lat, lon, self.lats[index], self.lons[index])
+                    if distance <= radius:
+                        hits.append((distance, index))
+        hits.sort()
+
+        names, seen = [], set()
+        for _, index in hits:
+            name = self.names[index]
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+                if len(names) >= limit:
+                    break
+        return names
+
+
+class PoiIndexLoader:
+    """
+    Loads extracts from a file or directory and reloads them when they change.
+    Checks and rebuilds run on a background thread, so lookups never wait for them.
+    """
+
+    def __init__(self, path: str, check_interval: float = 60):
+        self.path = path
+        self.check_interval = check_interval
+        self.index: Optional[PoiIndex] = None
+        self._files: Dict[str, Tuple[float, List[dict]]] = {}  # path -> (mtime, regions)
+        self._checked_at = 0.0
+        self._lock = threading.Lock()  # held for a whole reload
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+
+    def _extract_files(self) -> List[str]:
+        if os.path.isdir(self.path):
+            return sorted(
+                os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(".json")
+            )
+        return [self.path] if os.path.exists(self.path) else []
+
+    def reload(self) -> bool:
+        """Re-reads changed extract files. Returns True if a new index was swapped in."""
+        with self._lock:
+            self._checked_at = time.time()
+            files = {}
+            changed = False
+            for path in self._extract_files():
+                try:
+                    mtime = os.path.getmtime(path)
+                    previous = self._files.get(path)
+                    if previous is not None and previous[0] == mtime:
+                        files[path] = previous
+                        continue
+                    with open(path, encoding="utf-8") as f:
+                        files[path] = (mtime, json.load(f).get("regions", []))
+                    changed = True
+                except (OSError, ValueError) as e:
+                    print(f"POI index: could not load {path}: {e}")
+                    if path in self._files:
+                        files[path] = self._files[path]
+            changed = changed or files.keys() != self._files.keys()
+            if not changed and self.index is not None:
+                return False
+
+            regions = [region for path in sorted(files) for region in files[path][1]]
+            self._files = files
+            self.index = PoiIndex(regions) if regions else None
+            return True
+
+    def get(self) -> Optional[PoiIndex]:
+        """
+        Current index. Once the check interval has passed, a background reload is
+        started and the index in use until it finishes is returned; before the first
+        load completes that is None.
+        """
+        if time.time() - self._checked_at >= self.check_interval:
+            self._start_reload()
+        return self.index
+
+    def _start_reload(self) -> None:
+        with self._thread_lock:
+            # A thread started before a fork is not alive in the child
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._checked_at = time.time()
+            self._thread = threading.Thread(target=self.reload, name="poi-index-reload", daemon=True)
+            self._thread.start()
+
+
+_loader = PoiIndexLoader(POI_INDEX_PATH, POI_INDEX_CHECK_INTERVAL)
+
+
+def get_index() -> Optional[PoiIndex]:
+    return _loader.get()
+
+
+def lookup(lat: float, lon: float, area_id: Optional[int], radius: float, limit: int = 10) -> Optional[List[str]]:
+    """
+    Answers a get_places query from the local index. Returns None when the index
+    does not cover the query, so the caller should ask Overpass.
+    """
+    index = get_index()
+    if index is None:
+        return None
+    if area_id:
+        names = index.area(area_id)
+        if names:
+            return names[:limit]
+    if index.covers(lat, lon, radius):
+        return index.radius(lat, lon, radius, limit)
+    return None
@@ -0,0 +1,71 @@
+"""
+Token buckets for pacing upstream calls. A caller opens a scope with one bucket
+per host; http_client then waits for a token before every synchronous attempt
+to a limited host made inside that scope.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_limits: contextvars.ContextVar[Optional[Dict[str, "TokenBucket"]]] = contextvars.ContextVar("rate_limits", default=None)
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available right now."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Waits for a token; returns False if none came within timeout."""
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if give_up is not None:
+                if now + wait > give_up:
+                    return False
+            time.sleep(wait)
+
+
+@contextmanager
+def scope(limits: Dict[str, TokenBucket]):
+    """Applies per-host buckets to the upstream calls made in the enclosed block."""
+    token = _limits.set(limits)
+    try:
+        yield
+    finally:
+        _limits.reset(token)
+
+
+def acquire(host: str) -> None:
+    """Waits for the current scope's bucket for host, if there is one."""
+    limits = _limits.get()
+    if limits:
+        bucket = limits.get(host)
+        if bucket is not None:
+            bucket.acquire()
@@ -0,0 +1,78 @@
+"""
+Traffic recorder. With RECORD_TRAFFIC on, every /chat message and every upstream
+response is appended to RECORD_PATH as one JSON line, so benchmarks/replay.py can
+re-send the messages later against the recorded upstream responses.
+
+Lines are written with a single O_APPEND write, so several worker processes can
+share one file. Recording reads streamed upstream bodies in full.
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+RECORD_TRAFFIC = os.environ.get("RECORD_TRAFFIC", "").lower() in ("1", "true", "yes")
+_DEFAULT_RECORD_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "traffic.jsonl")
+RECORD_PATH = os.environ.get("RECORD_PATH", _DEFAULT_RECORD_PATH)
+
+
+class TrafficRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _write(self, entry: dict) -> None:
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                # Forked workers open their own descriptor
+                if self._fd is None or self._pid != os.getpid():
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+                    self._pid = os.getpid()
+                os.write(self._fd, line)
+        except OSError as e:
+            print(f"Traffic recorder: could not write {self.path} ({e})")
+
+    def chat(self, arrived: float, message: Optional[str], status: int, seconds: float, response: Optional[str]) -> None:
+        self._write({
+            "type": "chat",
+            "t": round(arrived, 6),
+            "message": message,
+            "status": status,
+            "seconds": round(seconds, 6),
+            "response": response,
+        })
+
+    def upstream(self, upstream: str, method: str, url: str, body, status: int, seconds: float, content: bytes) -> None:
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", "replace")
+        self._write({
+            "type": "upstream",
+            "t": round(time.time(), 6),
+            "upstream": upstream,
+            "method": method,
+            "url": url,
+            "body": body or None,
+            "status": status,
+            "seconds": round(seconds, 6),
+            "response": content.decode("utf-8", "replace"),
+        })
+
+
+recorder = TrafficRecorder(RECORD_PATH)
+
+
+def record_chat(arrived: float, message: Optional[str], status: int, seconds: float, response: Optional[str]) -> None:
+    """Logs one /chat exchange; arrived is the wall-clock time the request came in."""
+    if RECORD_TRAFFIC:
+        recorder.chat(arrived, message, status, seconds, response)
+
+
+def record_upstream(upstream: str, method: str, url: str, body, status: int, seconds: float, content: bytes) -> None:
+    """Logs one upstream response; url includes the query string."""
+    if RECORD_TRAFFIC:
+        recorder.upstream(upstream, method, url, body, status, seconds, content)
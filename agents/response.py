@@ -0,0 +1,236 @@
+"""
+Structured replies. ParentAgent answers with a Reply made of small __slots__
+records (Location, Weather, Place) and text is rendered only at the edge, by
+render() for the chat UI or Reply.to_json() for API clients asking /chat for
+format=json.
+
+Complete replies are kept in a short-lived in-process cache keyed by the
+canonical location and the intent, so repeated questions skip the agents and,
+for JSON, the encoding too.
+"""
+import json
+import os
+from typing import List, Optional, Tuple
+from agents.cache import LRUCache, TieredCache
+from agents.geocoding import normalize_place_name
+
+# Replies include current weather, so they are kept for much less than the weather cache
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "60"))
+
+NO_LOCATION_MESSAGE = "I couldn't identify the location you want to visit. Please specify a city."
+TIMEOUT_MESSAGE = "Sorry, that took longer than expected. Please try again in a moment."
+
+# Reply statuses
+OK = "ok"
+NO_LOCATION = "no_location"
+NOT_FOUND = "not_found"
+TIMEOUT = "timeout"
+
+
+class Location:
+    __slots__ = ("name", "lat", "lon", "osm_id", "osm_type")
+
+    def __init__(self, name: str, lat: Optional[float] = None, lon: Optional[float] = None,
+                 osm_id: Optional[int] = None, osm_type: Optional[str] = None):
+        self.name = name
+        self.lat = lat
+        self.lon = lon
+        self.osm_id = osm_id
+        self.osm_type = osm_type
+
+    def to_dict(self) -> dict:
+        if self.lat is None:
+            return {"name": self.name}
+        # Five decimals is about a metre
+        return {"name": self.name, "lat": round(self.lat, 5), "lon": round(self.lon, 5)}
+
+
+class Weather:
+    """Current conditions as Open-Meteo reports them."""
+    __slots__ = ("temperature", "precipitation_probability")
+
+    def __init__(self, temperature: Optional[float], precipitation_probability: Optional[float] = 0):
+        self.temperature = temperature
+        self.precipitation_probability = precipitation_probability
+
+    def to_dict(self) -> dict:
+        return {"temperature_c": self.temperature, "precipitation_probability": self.precipitation_probability}
+
+    def __str__(self) -> str:
+        # The line get_weather returns
+        return weather_text(self)
+
+
+class Place:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Reply:
+    """
+    One answer. weather and places are None when not asked for or not available;
+    late lists the parts whose agents missed the deadline and unavailable those
+    whose upstream failed or had its circuit open.
+    """
+    __slots__ = ("status", "location", "intent", "weather", "places", "late", "unavailable", "_json")
+
+    def __init__(self, status: str, location: Optional[Location] = None, intent: Optional[str] = None,
+                 weather: Optional[Weather] = None, places: Optional[Tuple[Place, ...]] = None,
+                 late: Tuple[str, ...] = (), unavailable: Tuple[str, ...] = ()):
+        self.status = status
+        self.location = location
+        self.intent = intent
+        self.weather = weather
+        self.places = places
+        self.late = late
+        self.unavailable = unavailable
+        self._json = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether every part asked for arrived, which makes the reply worth caching."""
+        if self.status != OK or self.late or self.unavailable:
+            return False
+        wants_weather, wants_places = wanted_parts(self.intent)
+        return (not wants_weather or self.weather is not None) and (not wants_places or bool(self.places))
+
+    def for_location(self, name: str) -> "Reply":
+        """The same reply for another spelling of its location."""
+        if self.location is None or self.location.name == name:
+            return self
+        location = self.location
+        return Reply(self.status, Location(name, location.lat, location.lon, location.osm_id, location.osm_type),
+                     self.intent, self.weather, self.places, self.late, self.unavailable)
+
+    def to_dict(self) -> dict:
+        data = {"status": self.status}
+        if self.location is not None:
+            data["location"] = self.location.to_dict()
+        if self.intent is not None:
+            data["intent"] = self.intent
+        if self.weather is not None:
+            data["weather"] = self.weather.to_dict()
+        if self.places is not None:
+            data["places"] = [place.name for place in self.places]
+        if self.late:
+            data["late"] = list(self.late)
+        if self.unavailable:
+            data["unavailable"] = list(self.unavailable)
+        return data
+
+    def to_json(self) -> str:
+        """Compact JSON, encoded once per reply; cached replies reuse it."""
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+        return self._json
+
+
+def wanted_parts(intent: Optional[str]) -> Tuple[bool, bool]:
+    """Returns (wants_weather, wants_places) for an intent."""
+    return intent == "Weather" or intent == "Both", intent == "Places" or intent == "Both"
+
+
+# Text rendering
+
+def not_found_message(location: str) -> str:
+    return f"I couldn't find the location '{location}'. Please check the spelling or try a major city."
+
+
+def weather_text(weather: Weather) -> str:
+    if weather.temperature is not None:
+        return f"currently {weather.temperature}°C with a chance of {weather.precipitation_probability}% to rain"
+    return "Weather data unavailable."
+
+
+def weather_part(location: str, weather: Optional[Weather]) -> Optional[str]:
+    if weather is not None:
+        return f"In {location} it's {weather_text(weather)}."
+    return None
+
+
+def places_part(location: str, places: Optional[Tuple[Place, ...]]) -> str:
+    if places:
+        places_list = "\n".join(place.name for place in places)
+        return f"In {location} these are the places you can go:\n{places_list}"
+    return f"I couldn't find any specific tourist attractions in {location}."
+
+
+def late_part(location: str, kind: str) -> str:
+    """Stands in for a part whose agent missed the deadline."""
+    what = "The weather" if kind == "weather" else "Places to visit"
+    return f"{what} for {location} took too long to load. Please ask again in a moment."
+
+
+def unavailable_part(location: str, kind: str) -> str:
+    """Stands in for a part whose upstream failed or is cut off by its circuit breaker."""
+    if kind == "weather":
+        return f"The weather for {location} is unavailable right now. Please ask again in a moment."
+    return f"Places to visit for {location} are unavailable right now. Please ask again in a moment."
+
+
+def render_parts(reply: Reply) -> List[str]:
+    """The reply as text, one entry per part: weather first, then places."""
+    if reply.status == NO_LOCATION:
+        return [NO_LOCATION_MESSAGE]
+    if reply.status == TIMEOUT:
+        return [TIMEOUT_MESSAGE]
+    location = reply.location.name
+    if reply.status == NOT_FOUND:
+        return [not_found_message(location)]
+
+    parts = []
+    wants_weather, wants_places = wanted_parts(reply.intent)
+    if wants_weather:
+        part = _missing_part(reply, "weather") or weather_part(location, reply.weather)
+        if part:
+            parts.append(part)
+    if wants_places:
+        parts.append(_missing_part(reply, "places") or places_part(location, reply.places))
+    return parts
+
+
+def _missing_part(reply: Reply, kind: str) -> Optional[str]:
+    if kind in reply.late:
+        return late_part(reply.location.name, kind)
+    if kind in reply.unavailable:
+        return unavailable_part(reply.location.name, kind)
+    return None
+
+
+def render(reply: Reply) -> str:
+    return "\n\n".join(render_parts(reply))
+
+
+# Response cache
+
+_cache = TieredCache(LRUCache(RESPONSE_CACHE_SIZE), name="replies")
+
+
+def _cache_key(location: str, intent: str) -> str:
+    return f"{normalize_place_name(location)}|{intent}"
+
+
+def cached_reply(location: str, intent: str) -> Optional[Reply]:
+    """A cached reply to the same question about the same place, under this spelling."""
+    reply = _cache.get(_cache_key(location, intent))
+    return reply.for_location(location) if reply is not None else None
+
+
+def has_reply(location: str, intent: str) -> bool:
+    """Whether a reply is cached, without counting a lookup."""
+    return _cache.expires_at(_cache_key(location, intent)) is not None
+
+
+def cache_reply(reply: Reply) -> Reply:
+    """Caches the reply if it is complete; returns it."""
+    if reply.complete:
+        _cache.set(_cache_key(reply.location.name, reply.intent), reply, RESPONSE_CACHE_TTL)
+    return reply
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the response cache."""
+    return _cache.stats()
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict
+from agents import metrics
+
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the upstream
+    call and everyone who arrives while it is in flight shares its result.
+    Works for threads (do) and for coroutines on an event loop (do_async).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Future] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}  # (loop, key) -> task
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0}
+        _registry[name] = self
+
+    def _count(self, coalesced: bool) -> None:
+        with self._lock:
+            self._stats["coalesced" if coalesced else "calls"] += 1
+        if coalesced:
+            metrics.COALESCED_CALLS.inc(group=self.name)
+
+    def do(self, key: str, func, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        self._count(coalesced=not leader)
+        if not leader:
+            return future.result()
+
+        # The future is only done early if something cancelled it; the result is still ours
+        try:
+            result = func(*args)
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        else:
+            if not future.done():
+                future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: str, coro_func, *args):
+        # A thread already fetching this key can serve async callers too
+        with self._lock:
+            future = self._calls.get(key)
+        if future is not None:
+            self._count(coalesced=True)
+            # shield: the thread leader's future is shared with its thread followers
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        task = self._tasks.get(task_key)
+        self._count(coalesced=task is not None)
+        if task is None:
+            task = self._tasks[task_key] = loop.create_task(coro_func(*args))
+            task.add_done_callback(lambda _: self._tasks.pop(task_key, None))
+        # shield: one caller being cancelled must not cancel the shared call
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["in_flight"] = len(self._calls) + len(self._tasks)
+        return stats
+
+
+def get_stats() -> dict:
+    """Calls made and calls coalesced, per single-flight group."""
+    return {name: flight.stats() for name, flight in _registry.items()}
@@ -0,0 +1,196 @@
+"""
+Background cache warmer. Off unless WARM_ENABLED is set; every WARM_INTERVAL seconds it
+makes sure the top destinations have geocodes, weather and places cached,
+refreshing entries that expire within WARM_REFRESH_AHEAD seconds so users
+never hit the cold path for them.
+
+Destinations come from WARM_DESTINATIONS (comma-separated) plus the most
+requested locations seen in live traffic, which are saved to WARM_STATE_PATH
+so they survive deploys. With a shared cache backend only one worker process
+on the host warms it; with the per-process memory backend every worker warms
+its own, so WARM_RATES are split across the WEB_CONCURRENCY workers to keep
+the host's total the same. The warmer runs on its own WARM_CONCURRENCY threads,
+not the shared agent executor. Its upstream calls are paced by per-host token
+buckets so they cannot trip upstream rate limits, run as admission.background()
+work so they leave upstream slots free for /chat traffic, and each gets at most
+WARM_CALL_DEADLINE seconds.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urlsplit
+from agents import admission, cache, deadline, geocoding, places, rate_limit, weather
+
+WARM_ENABLED = os.environ.get("WARM_ENABLED", "").lower() in ("1", "true", "yes")
+WARM_DESTINATIONS = [name.strip() for name in os.environ.get("WARM_DESTINATIONS", "").split(",") if name.strip()]
+WARM_TOP_N = int(os.environ.get("WARM_TOP_N", "50"))  # learned destinations kept warm
+WARM_INTERVAL = float(os.environ.get("WARM_INTERVAL", "60"))
+# Must exceed WARM_INTERVAL so entries are refreshed before they expire
+WARM_REFRESH_AHEAD = float(os.environ.get("WARM_REFRESH_AHEAD", "180"))
+WARM_CONCURRENCY = int(os.environ.get("WARM_CONCURRENCY", "2"))
+# Time budget in seconds for warming one destination's geocode or places, or one weather pass
+WARM_CALL_DEADLINE = float(os.environ.get("WARM_CALL_DEADLINE", "10"))
+_DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "top_destinations.json")
+WARM_STATE_PATH = os.environ.get("WARM_STATE_PATH", _DEFAULT_STATE_PATH)
+
+# Worker processes on the host (as gunicorn reads it), each warming its own memory cache
+WARM_WORKERS = max(int(os.environ.get("WEB_CONCURRENCY", "1")), 1)
+
+# Upstream calls per second the warmer may make from this host, per service (bursts of one)
+WARM_RATES = {
+    geocoding.PHOTON_URL: float(os.environ.get("WARM_PHOTON_RATE", "1")),
+    weather.OPEN_METEO_URL: float(os.environ.get("WARM_OPEN_METEO_RATE", "1")),
+    places.OVERPASS_URL: float(os.environ.get("WARM_OVERPASS_RATE", "0.2")),
+}
+
+
+class CacheWarmer:
+    def __init__(self, destinations: List[str], top_n: int = WARM_TOP_N, state_path: Optional[str] = WARM_STATE_PATH):
+        self.destinations = destinations
+        self.top_n = top_n
+        self.state_path = state_path
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        # Per-process caches are warmed by every worker, so each gets its share of the rates
+        workers = WARM_WORKERS if cache.CACHE_BACKEND == "memory" else 1
+        self._limits = {urlsplit(url).hostname: rate_limit.TokenBucket(rate / workers)
+                        for url, rate in WARM_RATES.items() if rate > 0}
+        self._stats = {"cycles": 0, "destinations_warmed": 0, "weather_cells_fetched": 0, "last_cycle_seconds": None}
+        self._load_state()
+
+    def record(self, location: str) -> None:
+        """Counts a requested location towards the learned top destinations."""
+        key = geocoding.normalize_place_name(location)
+        if key:
+            with self._lock:
+                self._counts[key] += 1
+
+    def top_destinations(self) -> List[str]:
+        """Configured destinations first, then the most requested ones."""
+        with self._lock:
+            learned = [name for name, _ in self._counts.most_common(self.top_n)]
+        return list(dict.fromkeys(self.destinations + learned))
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        # Several workers sharing a cache backend only need one of them warming it
+        if cache.CACHE_BACKEND != "memory" and not _claim_leadership():
+            return
+        while not self._stop.is_set():
+            try:
+                self.warm_once()
+            except Exception as e:
+                print(f"Cache warmer: cycle failed: {e}")
+            self._save_state()
+            self._stop.wait(WARM_INTERVAL)
+
+    def warm_once(self) -> None:
+        """Warms every top destination once: geocodes, then weather in batches, then places."""
+        started = time.perf_counter()
+        destinations = self.top_destinations()
+        with ThreadPoolExecutor(WARM_CONCURRENCY, thread_name_prefix="warmer") as pool:
+            coords = [c for c in pool.map(self._in_scope(geocoding.warm_coordinates), destinations,
+                                         [WARM_REFRESH_AHEAD] * len(destinations)) if c]
+            cells = self._in_scope(weather.warm_weather)([c[:2] for c in coords], WARM_REFRESH_AHEAD)
+            list(pool.map(self._in_scope(self._warm_places), coords))
+
+        with self._lock:
+            self._stats["cycles"] += 1
+            self._stats["destinations_warmed"] += len(coords)
+            self._stats["weather_cells_fetched"] += cells
+            self._stats["last_cycle_seconds"] = round(time.perf_counter() - started, 3)
+
+    def _in_scope(self, func):
+        # Pool threads do not inherit the caller's context, so open the scopes there
+        def run(*args):
+            with rate_limit.scope(self._limits), admission.background(), deadline.scope(WARM_CALL_DEADLINE):
+                return func(*args)
+        return run
+
+    @staticmethod
+    def _warm_places(coords) -> None:
+        lat, lon, osm_id, osm_type = coords
+        places.warm_places(lat, lon, osm_id, osm_type, refresh_ahead=WARM_REFRESH_AHEAD)
+
+    def _load_state(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self._counts.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Cache warmer: could not read {self.state_path} ({e})")
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        with self._lock:
+            counts = dict(self._counts.most_common(self.top_n * 4))
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(counts, f)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            print(f"Cache warmer: could not save {self.state_path} ({e})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked_destinations"] = len(self._counts)
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["destinations"] = len(self.top_destinations())
+        return stats
+
+
+_leader_lock = None
+
+
+def _claim_leadership() -> bool:
+    """Takes a host-wide lock so only one worker process warms a shared cache."""
+    global _leader_lock
+    try:
+        import fcntl
+    except ImportError:
+        return True
+    path = os.path.join(os.path.dirname(cache.CACHE_PATH) or ".", "warmer.lock")
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handle = open(path, "w")
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    _leader_lock = handle  # held for the life of the process
+    return True
+
+
+warmer = CacheWarmer(WARM_DESTINATIONS)
+
+
+def start() -> None:
+    """Starts the background warmer if WARM_ENABLED is on."""
+    if WARM_ENABLED:
+        warmer.start()
+
+
+def record(location: str) -> None:
+    warmer.record(location)
+
+
+def get_stats() -> dict:
+    """Warm cycles run, entries warmed and the size of the destination list."""
+    return warmer.stats()
@@ -1,30 +1,284 @@
-import requests
-from typing import Optional
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from agents import admission, deadline, geohash, http_client, metrics
+from agents.cache import open_cache
+from agents.response import Weather, weather_text
 
-def get_weather(lat: float, lon: float) -> Optional[str]:
-    """
-    Fetches current weather and forecast for given coordinates using Open-Meteo API.
-    """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
+OPEN_METEO_URL = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+OPEN_METEO_MAX_IN_FLIGHT = int(os.environ.get("OPEN_METEO_MAX_IN_FLIGHT", "8"))  # per worker process
+OPEN_METEO_RATE = float(os.environ.get("OPEN_METEO_RATE", "0"))  # calls per second, 0 for no limit
+
+admission.limit_upstream("open_meteo", OPEN_METEO_URL, OPEN_METEO_MAX_IN_FLIGHT, OPEN_METEO_RATE, burst=OPEN_METEO_MAX_IN_FLIGHT)
+
+# Weather is cached per geohash cell: precision 5 is about 4.9 x 4.9 km
+WEATHER_GEOHASH_PRECISION = int(os.environ.get("WEATHER_GEOHASH_PRECISION", "5"))
+WEATHER_CACHE_SIZE = int(os.environ.get("WEATHER_CACHE_SIZE", "4096"))
+WEATHER_CACHE_TTL = float(os.environ.get("WEATHER_CACHE_TTL", "600"))  # 10 minutes
+# Hits within this many seconds of expiry trigger a background refresh
+WEATHER_REFRESH_AHEAD = float(os.environ.get("WEATHER_REFRESH_AHEAD", "120"))
+# Misses arriving within this window are sent to Open-Meteo as one request
+WEATHER_BATCH_WINDOW = float(os.environ.get("WEATHER_BATCH_WINDOW", "0.02"))
+WEATHER_BATCH_SIZE = int(os.environ.get("WEATHER_BATCH_SIZE", "50"))
+
+# bucket -> (fetched_at, current conditions)
+_cache = open_cache("weather", WEATHER_CACHE_SIZE)
+
+
+def _weather_params(lat: float, lon: float) -> dict:
+    return {
         "latitude": lat,
         "longitude": lon,
         "current": ["temperature_2m", "precipitation_probability"],
         "timezone": "auto"
     }
 
+
+def _weather_record(current: dict) -> Weather:
+    return Weather(current.get("temperature_2m"), current.get("precipitation_probability", 0))
+
+
+def weather_bucket(lat: float, lon: float) -> str:
+    return geohash.encode(lat, lon, WEATHER_GEOHASH_PRECISION)
+
+
+def _fetch_buckets(buckets: List[str]) -> Dict[str, dict]:
+    """
+    Fetches current conditions for several buckets in one Open-Meteo request,
+    using each bucket's centre, and caches them.
+    """
+    centers = [geohash.decode_center(bucket) for bucket in buckets]
+    params = _weather_params(
+        ",".join(f"{lat:.4f}" for lat, _ in centers),
+        ",".join(f"{lon:.4f}" for _, lon in centers),
+    )
+    response = http_client.get(OPEN_METEO_URL, params=params)
+    response.raise_for_status()
+    data = response.json()
+    # A single location comes back as an object, several as a list
+    locations = data if isinstance(data, list) else [data]
+
+    results = {}
+    fetched_at = time.time()
+    for bucket, location in zip(buckets, locations):
+        current = location.get("current", {})
+        results[bucket] = current
+        _cache.set(bucket, (fetched_at, current), WEATHER_CACHE_TTL)
+    return results
+
+
+class _WeatherBatcher:
+    """
+    Collects bucket misses for a short window and fetches them in one request.
+    A bucket already being fetched is not requested twice.
+    """
+
+    def __init__(self, window: float, max_size: int):
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[str, Future] = {}  # waiting for the next flush
+        self._inflight: Dict[str, Future] = {}  # pending or being fetched
+        self._timer = None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "buckets": 0, "coalesced": 0}
+
+    def submit(self, bucket: str) -> Future:
+        flush_now = False
+        with self._lock:
+            future = self._inflight.get(bucket)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                metrics.COALESCED_CALLS.inc(group="weather")
+                return future
+            future = Future()
+            self._pending[bucket] = future
+            self._inflight[bucket] = future
+            if len(self._pending) >= self.max_size:
+                flush_now = True
+            elif self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            # Not on the agent executor, whose threads may be the ones waiting on this
+            # batch; not on the caller either, which may be the agent event loop
+            threading.Thread(target=self.flush, name="weather-flush", daemon=True).start()
+        return future
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not batch:
+                return
+            self._stats["requests"] += 1
+            self._stats["buckets"] += len(batch)
+
+        try:
+            results = _fetch_buckets(list(batch))
+        except Exception as e:
+            results = e
+        with self._lock:
+            for bucket in batch:
+                self._inflight.pop(bucket, None)
+        for bucket, future in batch.items():
+            # A future cancelled by a caller must not keep the rest of the batch waiting
+            if future.done():
+                continue
+            if isinstance(results, Exception):
+                future.set_exception(results)
+            else:
+                future.set_result(results.get(bucket, {}))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._inflight)
+        return stats
+
+
+_batcher = _WeatherBatcher(WEATHER_BATCH_WINDOW, WEATHER_BATCH_SIZE)
+
+
+def _cached_weather(bucket: str) -> Optional[dict]:
+    """Cached conditions for a bucket, refreshing them in the background when close to expiry."""
+    return _refresh_ahead(bucket, _cache.get(bucket))
+
+
+async def _cached_weather_async(bucket: str) -> Optional[dict]:
+    return _refresh_ahead(bucket, await _cache.get_async(bucket))
+
+
+def _refresh_ahead(bucket: str, cached) -> Optional[dict]:
+    if cached is None:
+        return None
+    fetched_at, current = cached
+    if time.time() - fetched_at >= WEATHER_CACHE_TTL - WEATHER_REFRESH_AHEAD:
+        _batcher.submit(bucket)
+    return current
+
+
+def is_cached(lat: float, lon: float) -> bool:
+    """Whether the weather for a location can be served from the cache."""
+    return _cache.expires_at(weather_bucket(lat, lon)) is not None
+
+
+def get_weather(lat: float, lon: float) -> Optional[str]:
+    """
+    Fetches current weather and forecast for given coordinates using Open-Meteo API.
+    Results are cached per geohash cell, and concurrent misses are batched into one request.
+    Returns the conditions as text, or None when they could not be fetched.
+    """
+    return _text(get_current_weather(lat, lon))
+
+
+def get_current_weather(lat: float, lon: float) -> Optional[Weather]:
+    """Like get_weather, but returns the Weather record the text is rendered from."""
+    bucket = weather_bucket(lat, lon)
+    current = _cached_weather(bucket)
+    if current is not None:
+        return _weather_record(current)
+
+    try:
+        current = _batcher.submit(bucket).result(timeout=deadline.clamp(http_client.host_timeout(OPEN_METEO_URL) + 1))
+        return _weather_record(current)
+    except Exception as e:
+        print(f"Error fetching weather: {e}")
+        metrics.AGENT_ERRORS.inc(agent="weather")
+        return None
+
+
+def get_weather_many(coordinates: List[Tuple[float, float]]) -> List[Optional[str]]:
+    """
+    Weather for several locations, in order. Cache misses are fetched together in one request.
+    """
+    return [_text(weather) for weather in get_current_weather_many(coordinates)]
+
+
+def get_current_weather_many(coordinates: List[Tuple[float, float]]) -> List[Optional[Weather]]:
+    """Like get_weather_many, but returns Weather records."""
+    buckets = [weather_bucket(lat, lon) for lat, lon in coordinates]
+    found = {}
+    for bucket in buckets:
+        if bucket not in found:
+            current = _cached_weather(bucket)
+            if current is not None:
+                found[bucket] = current
+
+    missing = [bucket for bucket in dict.fromkeys(buckets) if bucket not in found]
+    for start in range(0, len(missing), WEATHER_BATCH_SIZE):
+        chunk = missing[start:start + WEATHER_BATCH_SIZE]
+        try:
+            found.update(_fetch_buckets(chunk))
+        except Exception as e:
+            print(f"Error fetching weather: {e}")
+            metrics.AGENT_ERRORS.inc(agent="weather")
+
+    return [_weather_record(found[bucket]) if bucket in found else None for bucket in buckets]
+
+
+def warm_weather(coordinates: List[Tuple[float, float]], refresh_ahead: float) -> int:
+    """
+    For the cache warmer: fetches weather for the locations whose cell is not cached
+    or expires within refresh_ahead seconds, in batched requests on this thread.
+    Returns the number of cells fetched.
+    """
+    now = time.time()
+    due = []
+    for bucket in dict.fromkeys(weather_bucket(lat, lon) for lat, lon in coordinates):
+        expires_at = _cache.expires_at(bucket)
+        if expires_at is None or expires_at - now <= refresh_ahead:
+            due.append(bucket)
+
+    fetched = 0
+    for start in range(0, len(due), WEATHER_BATCH_SIZE):
+        chunk = due[start:start + WEATHER_BATCH_SIZE]
+        try:
+            fetched += len(_fetch_buckets(chunk))
+        except Exception as e:
+            print(f"Error fetching weather: {e}")
+            metrics.AGENT_ERRORS.inc(agent="weather")
+    return fetched
+
+
+async def get_weather_async(lat: float, lon: float) -> Optional[str]:
+    """
+    Async counterpart of get_weather. Misses join the same batches as sync callers.
+    """
+    return _text(await get_current_weather_async(lat, lon))
+
+
+async def get_current_weather_async(lat: float, lon: float) -> Optional[Weather]:
+    """Async counterpart of get_current_weather."""
+    bucket = weather_bucket(lat, lon)
+    current = await _cached_weather_async(bucket)
+    if current is not None:
+        return _weather_record(current)
+
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        current = data.get("current", {})
-        temp = current.get("temperature_2m")
-        precip_prob = current.get("precipitation_probability", 0)
-        
-        if temp is not None:
-            return f"currently {temp}°C with a chance of {precip_prob}% to rain"
-        return "Weather data unavailable."
+        # shield: every caller of this cell in the batch shares the future
+        current = await asyncio.shield(asyncio.wrap_future(_batcher.submit(bucket)))
+        return _weather_record(current)
     except Exception as e:
         print(f"Error fetching weather: {e}")
+        metrics.AGENT_ERRORS.inc(agent="weather")
         return None
+
+
+def _text(weather: Optional[Weather]) -> Optional[str]:
+    return weather_text(weather) if weather is not None else None
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss counters for the weather cache."""
+    return _cache.stats()
+
+
+def get_batch_stats() -> dict:
+    """Open-Meteo requests sent, buckets fetched and lookups coalesced onto in-flight fetches."""
+    return _batcher.stats()
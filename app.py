@@ -1,22 +1,184 @@
-from flask import Flask, render_template, request, jsonify
+import json
+import os
+import time
+from flask import Flask, Response, abort, g, render_template, request, jsonify, stream_with_context
 from agents.parent import ParentAgent
+from agents import admission, circuit_breaker, geocoding, http_client, metrics, places, recorder, singleflight, warmer, weather
+from agents import response as replies
+from agents.executor import run_async
+from agents.negative_cache import negative_cache
 
 app = Flask(__name__)
 agent = ParentAgent()
 
+# Keep the top destinations cached from the start (opt-in with WARM_ENABLED=1)
+warmer.start()
+
+# Largest number of messages accepted by /chat/batch
+BATCH_MAX_MESSAGES = int(os.environ.get("BATCH_MAX_MESSAGES", "1000"))
+
+# When set, admin routes require a matching X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Endpoints timed into chat_request_seconds
+CHAT_ENDPOINTS = {'chat', 'chat_stream', 'chat_batch'}
+
+BUSY_MESSAGE = "We're busy right now. Please try again in a moment."
+
+# Add a Server-Timing header to every chat response, not only to requests sending X-Timing: 1
+TIMING_HEADER = os.environ.get("TIMING_HEADER", "").lower() in ("1", "true", "yes")
+
+def require_admin():
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        abort(403)
+
+@app.before_request
+def start_request_timing():
+    if request.endpoint in CHAT_ENDPOINTS:
+        g.started = time.perf_counter()
+        g.timings = metrics.start_timing()
+        metrics.CHAT_IN_FLIGHT.inc(endpoint=request.endpoint)
+
+@app.before_request
+def admit_chat_request():
+    """
+    Bounds the chat requests processed at once. Messages the caches can answer skip
+    the queue; the rest wait for a slot and get a 503 when the queue is full.
+    """
+    if request.endpoint not in CHAT_ENDPOINTS:
+        return None
+    if request.endpoint in ('chat', 'chat_stream'):
+        data = request.get_json(silent=True)
+        message = data.get('message') if isinstance(data, dict) else None
+        if isinstance(message, str) and message and agent.can_serve_from_cache(message):
+            admission.chat_admission.skip_queue()
+            return None
+    if not admission.chat_admission.admit():
+        return jsonify({'response': BUSY_MESSAGE}), 503, {'Retry-After': '1'}
+    g.admitted = True
+    return None
+
+@app.after_request
+def finish_request_timing(response):
+    started = g.pop('started', None)
+    if started is None:
+        return response
+    admitted = g.pop('admitted', False)
+    endpoint = request.endpoint
+    # With RECORD_TRAFFIC on, /chat exchanges are logged for benchmarks/replay.py
+    record = chat_record(response) if recorder.RECORD_TRAFFIC and endpoint == 'chat' else None
+    status = str(response.status_code)
+    if TIMING_HEADER or request.headers.get('X-Timing') == '1':
+        # Streamed replies only carry the stages finished before the first byte
+        response.headers['Server-Timing'] = metrics.server_timing(g.timings, time.perf_counter() - started)
+
+    def finish():
+        # Runs once the body is fully sent, so streamed replies are timed end to end
+        seconds = time.perf_counter() - started
+        metrics.CHAT_REQUEST_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+        metrics.CHAT_IN_FLIGHT.dec(endpoint=endpoint)
+        if admitted:
+            admission.chat_admission.release()
+        if record is not None:
+            recorder.record_chat(time.time() - seconds, record[0], response.status_code, seconds, record[1])
+
+    response.call_on_close(finish)
+    return response
+
+def chat_record(response):
+    """(message, reply) of a /chat exchange, for the traffic recorder."""
+    data = request.get_json(silent=True)
+    reply = response.get_json(silent=True)
+    return (data.get('message') if isinstance(data, dict) else None,
+            reply.get('response') if isinstance(reply, dict) else None)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    """
+    Replies with {'response': text}. With ?format=json the structured reply is
+    returned instead (see agents.response), for API clients that do their own rendering.
+    """
     data = request.json
     user_message = data.get('message')
     if not user_message:
         return jsonify({'response': 'Please enter a message.'}), 400
     
-    response = agent.process_message(user_message)
-    return jsonify({'response': response})
+    # Run on the shared agent loop so all requests reuse one pooled async HTTP client.
+    # The request thread waits for the reply, so requests in flight per process are
+    # still bounded by the server's threads (gunicorn --threads); asgi.py serves
+    # /chat without holding a thread per request.
+    reply = run_async(agent.answer_async(user_message)).result()
+    if request.args.get('format') == 'json':
+        return Response(reply.to_json(), mimetype='application/json')
+    return jsonify({'response': replies.render(reply)})
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Server-sent events: one `part` event per reply part as soon as it is ready,
+    then a `done` event.
+    """
+    data = request.json
+    user_message = data.get('message')
+    if not user_message:
+        return jsonify({'response': 'Please enter a message.'}), 400
+
+    def events():
+        for part in agent.stream_message(user_message):
+            yield f"event: part\ndata: {json.dumps({'response': part})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    data = request.json
+    messages = data.get('messages') if isinstance(data, dict) else None
+    if not isinstance(messages, list) or not all(isinstance(m, str) and m for m in messages):
+        return jsonify({'error': "Expected 'messages': a list of non-empty strings."}), 400
+    if len(messages) > BATCH_MAX_MESSAGES:
+        return jsonify({'error': f'At most {BATCH_MAX_MESSAGES} messages per batch.'}), 413
+
+    responses = agent.process_batch(messages)
+    return jsonify({'responses': responses})
+
+@app.route('/admin/negative-cache', methods=['GET', 'DELETE'])
+def admin_negative_cache():
+    require_admin()
+    if request.method == 'DELETE':
+        kind = request.args.get('kind')
+        if kind and kind not in negative_cache.ttls:
+            return jsonify({'error': f'Unknown kind: {kind}'}), 400
+        negative_cache.clear(kind)
+    return jsonify(negative_cache.snapshot())
+
+@app.route('/admin/stats')
+def admin_stats():
+    require_admin()
+    return jsonify({
+        'caches': {
+            'geocode': geocoding.get_cache_stats(),
+            'weather': weather.get_cache_stats(),
+            'places': places.get_cache_stats(),
+            'replies': replies.get_cache_stats(),
+        },
+        'coalescing': singleflight.get_stats(),
+        'weather_batches': weather.get_batch_stats(),
+        'http': http_client.get_stats(),
+        'circuits': circuit_breaker.get_stats(),
+        'warmer': warmer.get_stats(),
+        'admission': admission.get_stats(),
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition; counts are per worker process."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
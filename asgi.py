@@ -0,0 +1,110 @@
+"""
+ASGI entry point. POST /chat is served by an async view that awaits the agents
+on the server's event loop, so a request waiting on upstreams holds no thread:
+requests in flight per process are bounded by admission control
+(CHAT_MAX_IN_FLIGHT), not by a thread count. Every other route is the Flask
+app from app.py, run through asgiref's WSGI adapter.
+
+Run with:  uvicorn asgi:app --workers 2
+      or:  hypercorn asgi:app --workers 2
+"""
+import asyncio
+import json
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+from asgiref.wsgi import WsgiToAsgi
+from agents import admission, metrics, recorder
+from agents import response as replies
+from app import BUSY_MESSAGE, TIMING_HEADER, agent, app as flask_app
+
+_flask = WsgiToAsgi(flask_app)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        await chat(scope, receive, send)
+    else:
+        await _flask(scope, receive, send)
+
+
+async def chat(scope, receive, send):
+    """
+    Same contract as app.py's /chat: replies with {'response': text}, or with the
+    structured reply for ?format=json, and is timed and admitted the same way.
+    """
+    started = time.perf_counter()
+    timings = metrics.start_timing()
+    metrics.CHAT_IN_FLIGHT.inc(endpoint="chat")
+    admitted = False
+    message = None
+    status, body = 500, b""
+    try:
+        data = _json(await _read_body(receive))
+        message = data.get("message") if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message:
+            status, body = 400, _json_body({'response': 'Please enter a message.'})
+        # Peeking may read a shared cache backend, so keep it off the loop
+        elif await asyncio.get_running_loop().run_in_executor(None, agent.can_serve_from_cache, message):
+            admission.chat_admission.skip_queue()
+            status, body = await _answer(scope, message)
+        elif not await admission.chat_admission.admit_async():
+            status, body = 503, _json_body({'response': BUSY_MESSAGE})
+        else:
+            admitted = True
+            status, body = await _answer(scope, message)
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.CHAT_REQUEST_SECONDS.observe(seconds, endpoint="chat", status=str(status))
+        metrics.CHAT_IN_FLIGHT.dec(endpoint="chat")
+        if admitted:
+            admission.chat_admission.release()
+
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if status == 503:
+        headers.append((b"retry-after", b"1"))
+    if TIMING_HEADER or _header(scope, b"x-timing") == b"1":
+        headers.append((b"server-timing", metrics.server_timing(timings, seconds).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+    if recorder.RECORD_TRAFFIC:
+        reply = _json(body)
+        recorder.record_chat(time.time() - seconds, message, status,
+                             seconds, reply.get('response') if isinstance(reply, dict) else None)
+
+
+async def _answer(scope, message: str):
+    reply = await agent.answer_async(message)
+    if parse_qs(scope.get("query_string", b"").decode()).get("format") == ["json"]:
+        return 200, reply.to_json().encode()
+    return 200, _json_body({'response': replies.render(reply)})
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        event = await receive()
+        if event["type"] == "http.disconnect":
+            return body
+        body += event.get("body", b"")
+        if not event.get("more_body"):
+            return body
+
+
+def _json(body: bytes):
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def _json_body(payload: dict) -> bytes:
+    return (json.dumps(payload) + "\n").encode()
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value
+    return None
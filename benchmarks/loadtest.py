@@ -0,0 +1,195 @@
+"""
+Load test for app.py under gunicorn, against local upstream stubs.
+
+Starts the stubs, launches gunicorn with the agents pointed at them, sends a
+realistic mix of weather / places / both messages, and reports throughput and
+p50/p95/p99 latency per intent. Results are saved as JSON for comparison with
+benchmarks/results.py.
+
+Usage: python benchmarks/loadtest.py [--requests 2000] [--concurrency 32] [--workers 2]
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agents.nlp_parser import NLPParser
+from benchmarks.redis_stub import start_redis_stub
+from benchmarks.results import latency_summary, save_results
+from benchmarks.stubs import default_profiles, start_stubs
+
+# Traffic is dominated by a few hundred Indian cities; a popular head and a long tail
+CITIES = [
+    "Mumbai", "Delhi", "Bangalore", "Goa", "Jaipur", "Chennai", "Kolkata", "Hyderabad",
+    "Pune", "Agra", "Udaipur", "Varanasi", "Kochi", "Mysore", "Shimla", "Manali",
+    "Rishikesh", "Darjeeling", "Amritsar", "Ooty", "Munnar", "Leh", "Jodhpur", "Pondicherry",
+    "Hampi", "Madurai", "Coorg", "Alleppey", "Gangtok", "Shillong", "Ahmedabad", "Lucknow",
+    "Bhopal", "Indore", "Nagpur", "Surat", "Vadodara", "Chandigarh", "Dehradun", "Nainital",
+    "Mussoorie", "Haridwar", "Jaisalmer", "Pushkar", "Khajuraho", "Aurangabad", "Nashik",
+    "Visakhapatnam", "Tirupati", "Bhubaneswar",
+]
+
+TEMPLATES = [
+    "What's the weather in {city}?",
+    "is it raining in {city} today",
+    "{city} weather",
+    "Plan a trip to {city}",
+    "places to see in {city}",
+    "I want to visit {city}",
+    "weather and attractions in {city}",
+    "Going to {city}, what's the temperature and what should I see?",
+    "tell me about tomorrow",  # unresolvable, exercises the miss path
+]
+
+
+def build_messages(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    # Zipf-like popularity: the first cities get most of the traffic
+    weights = [1 / (rank + 1) for rank in range(len(CITIES))]
+    return [
+        rng.choice(TEMPLATES).format(city=rng.choices(CITIES, weights)[0])
+        for _ in range(count)
+    ]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(env: dict, port: int, workers: int, threads: int) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--worker-class", "gthread",
+        "--threads", str(threads),
+        "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start")
+
+
+def run_load(base_url: str, endpoint: str, messages: list, concurrency: int) -> dict:
+    parser = NLPParser()
+    local = threading.local()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def send(message):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        intent = parser.parse(message)[1]
+        start = time.perf_counter()
+        try:
+            response = session.post(base_url + endpoint, json={"message": message}, timeout=60)
+            response.content  # read the whole body, including streamed responses
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[intent].append(elapsed)
+            latencies["all"].append(elapsed)
+            if not ok:
+                errors[intent] += 1
+                errors["all"] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, messages))
+    elapsed = time.perf_counter() - start
+
+    per_intent = {}
+    for intent, values in latencies.items():
+        per_intent[intent] = latency_summary(values)
+        per_intent[intent]["errors"] = errors[intent]
+    return {
+        "requests": len(messages),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(messages) / elapsed, 2),
+        "latency": per_intent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /chat against local upstream stubs.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=32, help="threads per gunicorn worker")
+    parser.add_argument("--endpoint", default="/chat")
+    parser.add_argument("--latency", type=float, help="override mean upstream latency (s)")
+    parser.add_argument("--jitter", type=float, help="override upstream latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, help="override upstream 503 rate")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite", "redis"], default="memory",
+                        help="shared cache backend; redis runs against a local stand-in")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="result file (default benchmarks/results/loadtest-<time>.json)")
+    args = parser.parse_args()
+
+    stubs = start_stubs(default_profiles(args.latency, args.jitter, args.error_rate))
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Start cold: a fresh persistent cache, no offline data and no cache warmer for every run
+        env = dict(os.environ, **stubs.urls())
+        env["GEOCODE_CACHE_PATH"] = os.path.join(cache_dir, "geocode.sqlite3")
+        env["GAZETTEER_PATH"] = ""
+        env["POI_INDEX_PATH"] = os.path.join(cache_dir, "poi")
+        env["CACHE_BACKEND"] = args.cache_backend
+        env["WARM_ENABLED"] = "0"
+        env["CACHE_PATH"] = os.path.join(cache_dir, "shared.sqlite3")
+        if args.cache_backend == "redis":
+            redis = start_redis_stub()
+            env["CACHE_REDIS_URL"] = f"redis://127.0.0.1:{redis.server_address[1]}/0"
+        app = start_app(env, port, args.workers, args.threads)
+        try:
+            results = run_load(f"http://127.0.0.1:{port}", args.endpoint, build_messages(args.requests, args.seed), args.concurrency)
+        finally:
+            app.terminate()
+            app.wait()
+            stubs.shutdown()
+
+    results["config"] = {
+        "endpoint": args.endpoint,
+        "cache_backend": args.cache_backend,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "threads": args.threads,
+        "upstreams": {name: vars(profile) for name, profile in stubs.profiles.items()},
+    }
+    results["upstream_requests"] = dict(stubs.requests)
+
+    print(f"{results['requests']} requests in {results['duration_s']}s: {results['throughput_rps']} req/s")
+    for intent, summary in sorted(results["latency"].items()):
+        print(f"  {intent:8} n={summary['count']:5}  p50={summary['p50_ms']:8.1f}ms  "
+              f"p95={summary['p95_ms']:8.1f}ms  p99={summary['p99_ms']:8.1f}ms  errors={summary['errors']}")
+    print(f"  upstream requests: {results['upstream_requests']}")
+    print(f"Saved {save_results('loadtest', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Micro-benchmarks for the CPU-bound hot paths: NLPParser.parse against the
+previous per-message regex implementation (whose results it must match) and
+parse_many, the score_feature ranking of Photon results and reading place names
+out of a large Overpass body, fully decoded versus streamed. Results are saved
+as JSON.
+
+Usage: python benchmarks/micro.py [--repeat 5] [--output FILE]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.geocoding import _parse_photon, score_feature
+from agents.json_stream import iter_items
+from agents.places import OVERPASS_CHUNK_SIZE, _collect_places
+from agents.nlp_parser import NLPParser
+from benchmarks.results import save_results
+from benchmarks.stubs import overpass_response, photon_response
+
+MESSAGES = [
+    "What's the weather in Mumbai?",
+    "going to bangalore next week",
+    "I want to visit New Delhi and see the monuments",
+    "bangalore weather",
+    "Plan a trip to Kerala",
+    "places to see around jaipur",
+    "is it raining in kolkata today",
+    "Tell me about Goa",
+    "things to do near Mysore Palace",
+    "will it be hot when i travel to chennai",
+    "show me parks in Hyderabad",
+    "tomorrow",
+]
+
+
+class LegacyNLPParser(NLPParser):
+    """The per-message regex implementation NLPParser used before precompilation."""
+
+    def _extract_location(self, text: str) -> Optional[str]:
+        for prep in self.location_prepositions:
+            pattern = rf'\b{prep}\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)'
+            match = re.search(pattern, text)
+            if match:
+                location = match.group(1).strip()
+                if self._is_valid_location(location):
+                    return location
+            pattern_lower = rf'\b{prep}\s+([a-z][a-z]+(?:\s+[a-z]+)*)'
+            match = re.search(pattern_lower, text.lower())
+            if match:
+                raw_location = match.group(1).strip()
+                first_word = raw_location.split()[0]
+                if first_word in self.location_verbs or first_word in self.skip_words:
+                    parts = raw_location.split()
+                    if len(parts) > 1:
+                        raw_location = " ".join(parts[1:])
+                    else:
+                        continue
+                location = raw_location.title()
+                if self._is_valid_location(location):
+                    return location
+
+        for verb in self.location_verbs:
+            pattern = rf'\b{verb}\s+([A-Z][a-zA-Z]+(?:\s+[A-Z][a-zA-Z]+)*)'
+            match = re.search(pattern, text)
+            if match:
+                location = match.group(1).strip()
+                if self._is_valid_location(location):
+                    return location
+            pattern_lower = rf'\b{verb}\s+([a-z][a-z]+(?:\s+[a-z]+)*)'
+            match = re.search(pattern_lower, text.lower())
+            if match:
+                raw_location = match.group(1).strip()
+                first_word = raw_location.split()[0]
+                if first_word in self.skip_words:
+                    parts = raw_location.split()
+                    if len(parts) > 1:
+                        raw_location = " ".join(parts[1:])
+                    else:
+                        continue
+                location = raw_location.title()
+                if self._is_valid_location(location):
+                    return location
+
+        words = text.split()
+        for i, word in enumerate(words):
+            clean_word = re.sub(r'[^\w\s]', '', word)
+            if clean_word and len(clean_word) > 2:
+                if clean_word[0].isupper() and clean_word.lower() not in self.skip_words:
+                    if i > 0 or not self._is_sentence_start_word(clean_word):
+                        if self._is_valid_location(clean_word):
+                            return clean_word
+
+        words = text.lower().split()
+        for word in words:
+            clean_word = re.sub(r'[^\w\s]', '', word)
+            if len(clean_word) > 2 and clean_word not in self.skip_words:
+                if not any(kw in clean_word for kw in self.weather_keywords + self.places_keywords):
+                    return clean_word.title()
+
+        return None
+
+    def _determine_intent(self, text: str) -> str:
+        text_lower = text.lower()
+        has_weather = any(keyword in text_lower for keyword in self.weather_keywords)
+        has_places = any(keyword in text_lower for keyword in self.places_keywords)
+        if has_weather and has_places:
+            return "Both"
+        elif has_weather:
+            return "Weather"
+        return "Places"
+
+
+def best_of(stmt, number: int, repeat: int) -> float:
+    """Fastest mean time per call in microseconds."""
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6
+
+
+def large_overpass_body(elements: int = 5000) -> bytes:
+    """An area result set of `elements` POIs, as a big city without an `out` limit would return."""
+    data = overpass_response("[out:json];")
+    data["elements"] = [dict(element, id=i) for i in range(elements // len(data["elements"]))
+                        for element in data["elements"]]
+    return json.dumps(data).encode("utf-8")
+
+
+def chunked(body: bytes, size: int = OVERPASS_CHUNK_SIZE):
+    return (body[start:start + size] for start in range(0, len(body), size))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="result file (default benchmarks/results/micro-<time>.json)")
+    args = arg_parser.parse_args()
+
+    parser, legacy = NLPParser(), LegacyNLPParser()
+    for message in MESSAGES:
+        expected, actual = legacy.parse(message), parser.parse(message)
+        if expected != actual:
+            sys.exit(f"Mismatch for {message!r}: legacy={expected} current={actual}")
+    data = photon_response("Bangalore")
+    features = data["features"]
+    body = large_overpass_body()
+
+    results = {
+        "nlp_parse_legacy_us": round(best_of(lambda: [legacy.parse(m) for m in MESSAGES], 200, args.repeat) / len(MESSAGES), 3),
+        "nlp_parse_us": round(best_of(lambda: [parser.parse(m) for m in MESSAGES], 200, args.repeat) / len(MESSAGES), 3),
+        "nlp_parse_many_us": round(best_of(lambda: parser.parse_many(MESSAGES * 100), 2, args.repeat) / (len(MESSAGES) * 100), 3),
+        "score_feature_us": round(best_of(lambda: [score_feature(f) for f in features], 5000, args.repeat) / len(features), 3),
+        "pick_best_feature_us": round(best_of(lambda: _parse_photon(data, "Bangalore"), 5000, args.repeat), 3),
+        "overpass_large_json_us": round(best_of(
+            lambda: _collect_places(json.loads(b"".join(chunked(body)))["elements"], None), 20, args.repeat), 3),
+        "overpass_large_stream_us": round(best_of(
+            lambda: _collect_places(iter_items(chunked(body), "elements"), None), 20, args.repeat), 3),
+    }
+    for name, value in results.items():
+        print(f"{name:24} {value:10.3f}")
+    print(f"NLPParser.parse speedup over the legacy parser: {results['nlp_parse_legacy_us'] / results['nlp_parse_us']:.1f}x")
+    print(f"Saved {save_results('micro', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
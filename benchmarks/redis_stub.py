@@ -0,0 +1,160 @@
+"""
+Local stand-in for a Redis server, speaking just enough RESP2 for the
+CACHE_BACKEND=redis shared cache: PING, AUTH, SELECT, GET, SET [PX|EX], PTTL,
+DEL, SCAN, DBSIZE and FLUSHDB. Data lives in memory; maxkeys bounds it with
+LRU eviction, like a real server with maxmemory-policy allkeys-lru.
+
+Usage: python benchmarks/redis_stub.py [--port 6380] [--maxkeys 100000]
+
+Point the agents at it with:
+    CACHE_BACKEND=redis CACHE_REDIS_URL=redis://127.0.0.1:6380/0
+"""
+import argparse
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Error(Exception):
+    pass
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Pipelined replies go out as separate writes; do not let Nagle hold them back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            try:
+                reply = self.server.run(command)
+            except _Error as e:
+                self.wfile.write(b"-ERR %s\r\n" % str(e).encode("utf-8"))
+            else:
+                self.wfile.write(_encode(reply))
+            self.wfile.flush()
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()  # inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode("utf-8")
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
+
+
+class RedisStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, maxkeys: int = 100_000):
+        super().__init__(address, RespHandler)
+        self.maxkeys = maxkeys
+        self.data = OrderedDict()  # key -> (value, expires_at)
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        if entry is not None:
+            self.data.move_to_end(key)
+        return entry
+
+    def run(self, args):
+        name = args[0].decode("utf-8").upper()
+        with self._lock:
+            self.commands += 1
+            if name in ("PING", "AUTH", "SELECT"):
+                return "PONG" if name == "PING" else "OK"
+            if name == "GET":
+                entry = self._live(args[1])
+                return entry[0] if entry else None
+            if name == "SET":
+                expires_at = None
+                options = [arg.decode("utf-8").upper() for arg in args[3:]]
+                for option, value in zip(options, options[1:]):
+                    if option == "PX":
+                        expires_at = time.time() + int(value) / 1000
+                    elif option == "EX":
+                        expires_at = time.time() + int(value)
+                self.data[args[1]] = (args[2], expires_at)
+                self.data.move_to_end(args[1])
+                while len(self.data) > self.maxkeys:
+                    self.data.popitem(last=False)
+                return "OK"
+            if name == "PTTL":
+                entry = self._live(args[1])
+                if entry is None:
+                    return -2
+                return -1 if entry[1] is None else int((entry[1] - time.time()) * 1000)
+            if name == "DEL":
+                return sum(self.data.pop(key, None) is not None for key in args[1:])
+            if name == "SCAN":
+                # One pass over everything; a real server pages with the cursor
+                pattern = "*"
+                options = args[2:]
+                for option, value in zip(options, options[1:]):
+                    if option.upper() == b"MATCH":
+                        pattern = value.decode("utf-8")
+                keys = [key for key in list(self.data) if self._live(key) and fnmatch.fnmatchcase(key.decode("utf-8"), pattern)]
+                return [b"0", keys]
+            if name == "DBSIZE":
+                return len(self.data)
+            if name == "FLUSHDB":
+                self.data.clear()
+                return "OK"
+        raise _Error(f"unknown command '{name}'")
+
+
+def start_redis_stub(port: int = 0, maxkeys: int = 100_000) -> RedisStub:
+    """Starts the stand-in in a daemon thread; port 0 picks a free port."""
+    server = RedisStub(("127.0.0.1", port), maxkeys)
+    threading.Thread(target=server.serve_forever, name="redis-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a minimal in-memory Redis stand-in.")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--maxkeys", type=int, default=100_000)
+    args = parser.parse_args()
+
+    server = start_redis_stub(args.port, args.maxkeys)
+    print(f"CACHE_REDIS_URL=redis://127.0.0.1:{server.server_address[1]}/0")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
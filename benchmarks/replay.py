@@ -0,0 +1,317 @@
+"""
+Replays traffic recorded with RECORD_TRAFFIC=1 (see agents/recorder.py) against
+app.py under gunicorn, to reproduce production load offline and compare builds.
+
+The recorded upstream responses become a cassette served by a local server with
+their recorded latency, so no public API is touched; requests the cassette has
+no answer for fall back to the synthetic stubs and are counted as misses. The
+/chat messages are re-sent at their recorded offsets divided by --speed (1 for
+real time, 10 for ten times faster, 0 for as fast as --concurrency allows).
+
+Reports replayed latency per intent next to the recorded latency, cache hit
+rates from /admin/stats, cassette hits and misses, and how many replies differ
+from the recorded ones. Results are saved as JSON for benchmarks/results.py.
+
+Usage: python benchmarks/replay.py [LOG] [--speed 1] [--concurrency 64] [--workers 1]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agents.nlp_parser import NLPParser
+from agents.recorder import RECORD_PATH
+from benchmarks.loadtest import _free_port, start_app
+from benchmarks.results import latency_summary, save_results
+from benchmarks.stubs import PATHS, StubHandler, StubServer, default_profiles
+
+UPSTREAMS = {path: name for name, path in PATHS.items()}
+
+
+def load_log(path: str) -> Tuple[List[dict], List[dict]]:
+    """The recorded (chat, upstream) entries, each in recorded order. Unreadable lines are skipped."""
+    chats, upstreams = [], []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if entry.get("type") == "chat" and isinstance(entry.get("message"), str):
+                chats.append(entry)
+            elif entry.get("type") == "upstream":
+                upstreams.append(entry)
+    if skipped:
+        print(f"Skipped {skipped} unreadable lines in {path}")
+    chats.sort(key=lambda entry: entry["t"])
+    return chats, upstreams
+
+
+def _request_key(upstream: str, method: str, url: str, body: Optional[str]) -> tuple:
+    # Only the query and body identify a request; the recorded host and path were the real upstream's
+    return upstream, method, tuple(sorted(parse_qsl(urlsplit(url).query, keep_blank_values=True))), body or ""
+
+
+def _split_locations(key: tuple) -> Optional[Tuple[tuple, List[Tuple[str, str]]]]:
+    """For an Open-Meteo key: the key without coordinates and its (latitude, longitude) pairs."""
+    upstream, method, query, body = key
+    params = dict(query)
+    if upstream != "open_meteo" or "latitude" not in params or "longitude" not in params:
+        return None
+    rest = tuple(item for item in query if item[0] not in ("latitude", "longitude"))
+    return (upstream, method, rest, body), list(zip(params["latitude"].split(","), params["longitude"].split(",")))
+
+
+class Cassette:
+    """
+    Recorded upstream responses by request. A request recorded several times is
+    answered with its recordings in order, then the last one again. Open-Meteo
+    batches are also stored per location, because the replay groups cells into
+    batches differently.
+    """
+
+    def __init__(self, entries: List[dict]):
+        self._responses: Dict[tuple, List[Tuple[int, float, bytes]]] = defaultdict(list)
+        self._locations: Dict[tuple, Tuple[float, object]] = {}
+        self._served = defaultdict(int)
+        self._lock = threading.Lock()
+        for entry in entries:
+            key = _request_key(entry["upstream"], entry["method"], entry["url"], entry.get("body"))
+            content = entry["response"].encode("utf-8")
+            self._responses[key].append((entry["status"], entry["seconds"], content))
+            split = _split_locations(key)
+            if split is not None and entry["status"] == 200:
+                data = json.loads(content)
+                for location, result in zip(split[1], data if isinstance(data, list) else [data]):
+                    self._locations[split[0] + location] = (entry["seconds"], result)
+
+    def __len__(self) -> int:
+        return sum(len(responses) for responses in self._responses.values())
+
+    def lookup(self, upstream: str, method: str, url: str, body: str) -> Optional[Tuple[int, float, bytes]]:
+        """(status, seconds, body) for a request, or None if it was never recorded."""
+        key = _request_key(upstream, method, url, body)
+        with self._lock:
+            responses = self._responses.get(key)
+            if responses:
+                served = self._served[key]
+                self._served[key] += 1
+                return responses[min(served, len(responses) - 1)]
+
+        split = _split_locations(key)
+        if split is None:
+            return None
+        found = [self._locations.get(split[0] + location) for location in split[1]]
+        if not found or None in found:
+            return None
+        results = [result for _, result in found]
+        payload = results[0] if len(results) == 1 else results
+        return 200, max(seconds for seconds, _ in found), json.dumps(payload).encode("utf-8")
+
+
+class CassetteHandler(StubHandler):
+    def _replay(self, body: str) -> bool:
+        upstream = UPSTREAMS.get(urlsplit(self.path).path)
+        hit = self.server.cassette.lookup(upstream, self.command, self.path, body) if upstream else None
+        self.server.count_cassette(upstream, hit is not None)
+        if hit is None:
+            return False
+        status, seconds, content = hit
+        self.server.count(upstream)
+        time.sleep(seconds * self.server.latency_scale)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        return True
+
+    def do_GET(self):
+        if not self._replay(""):
+            super().do_GET()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8")
+        if not self._replay(body):
+            self.handle_post(body)
+
+
+class CassetteServer(StubServer):
+    """The upstream stubs, answering from a cassette where it has a recording."""
+
+    def __init__(self, address, cassette: Cassette, latency_scale: float = 1.0):
+        super().__init__(address, default_profiles())
+        self.RequestHandlerClass = CassetteHandler
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        self.cassette_hits = defaultdict(int)
+        self.cassette_misses = defaultdict(int)
+
+    def count_cassette(self, upstream: str, hit: bool) -> None:
+        with self._lock:
+            (self.cassette_hits if hit else self.cassette_misses)[upstream] += 1
+
+
+def start_cassette(cassette: Cassette, latency_scale: float = 1.0, port: int = 0) -> CassetteServer:
+    """Starts the cassette server in a daemon thread; port 0 picks a free port."""
+    server = CassetteServer(("127.0.0.1", port), cassette, latency_scale)
+    threading.Thread(target=server.serve_forever, name="cassette", daemon=True).start()
+    return server
+
+
+def run_replay(base_url: str, chats: List[dict], speed: float, concurrency: int) -> dict:
+    """
+    Sends the recorded messages on their recorded schedule scaled by speed. In timed
+    replays latency is measured from the scheduled send time, so requests delayed by
+    a saturated client still count their wait.
+    """
+    parser = NLPParser()
+    local = threading.local()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    mismatched = 0
+    lock = threading.Lock()
+    first = chats[0]["t"] if chats else 0
+
+    def send(entry, scheduled):
+        nonlocal mismatched
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        intent = parser.parse(entry["message"])[1]
+        try:
+            response = session.post(base_url + "/chat", json={"message": entry["message"]}, timeout=60)
+            reply = response.json().get("response") if response.status_code == 200 else None
+            ok = response.status_code == 200
+        except (requests.RequestException, ValueError):
+            reply, ok = None, False
+        elapsed = time.perf_counter() - scheduled
+        with lock:
+            latencies[intent].append(elapsed)
+            latencies["all"].append(elapsed)
+            if not ok:
+                errors[intent] += 1
+                errors["all"] += 1
+            if ok and entry.get("status") == 200 and reply != entry.get("response"):
+                mismatched += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for entry in chats:
+            scheduled = time.perf_counter()
+            if speed > 0:
+                scheduled = start + (entry["t"] - first) / speed
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            executor.submit(send, entry, scheduled)
+    elapsed = time.perf_counter() - start
+
+    per_intent = {}
+    for intent, values in latencies.items():
+        per_intent[intent] = latency_summary(values)
+        per_intent[intent]["errors"] = errors[intent]
+    return {
+        "requests": len(chats),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(chats) / elapsed, 2) if elapsed else 0.0,
+        "latency": per_intent,
+        "mismatched_replies": mismatched,
+    }
+
+
+def cache_hit_rates(base_url: str) -> Dict[str, float]:
+    """Hit rate per agent cache, from /admin/stats (one worker's view)."""
+    headers = {"X-Admin-Token": os.environ["ADMIN_TOKEN"]} if os.environ.get("ADMIN_TOKEN") else {}
+    caches = requests.get(base_url + "/admin/stats", headers=headers, timeout=10).json()["caches"]
+    return {
+        name: round(stats["hits"] / (stats["hits"] + stats["misses"]), 4) if stats["hits"] + stats["misses"] else 0.0
+        for name, stats in caches.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded /chat traffic against recorded upstream responses.")
+    parser.add_argument("log", nargs="?", default=RECORD_PATH, help=f"recorded traffic (default {RECORD_PATH})")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 10 = ten times faster, 0 = as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=64, help="most requests in flight at once")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers (cache hit rates cover one worker)")
+    parser.add_argument("--threads", type=int, default=32, help="threads per gunicorn worker")
+    parser.add_argument("--upstream-latency", type=float, default=1.0,
+                        help="scale for the recorded upstream latency; 0 answers immediately")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--output", help="result file (default benchmarks/results/replay-<time>.json)")
+    args = parser.parse_args()
+
+    chats, upstreams = load_log(args.log)
+    if not chats:
+        sys.exit(f"No /chat messages recorded in {args.log}")
+    cassette = start_cassette(Cassette(upstreams), args.upstream_latency)
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Cold start, as in the load test, and no recording of the replay itself
+        env = dict(os.environ, **cassette.urls())
+        env["GEOCODE_CACHE_PATH"] = os.path.join(cache_dir, "geocode.sqlite3")
+        env["GAZETTEER_PATH"] = ""
+        env["POI_INDEX_PATH"] = os.path.join(cache_dir, "poi")
+        env["CACHE_BACKEND"] = args.cache_backend
+        env["CACHE_PATH"] = os.path.join(cache_dir, "shared.sqlite3")
+        env["WARM_ENABLED"] = "0"
+        env["RECORD_TRAFFIC"] = "0"
+        app = start_app(env, port, args.workers, args.threads)
+        try:
+            results = run_replay(base_url, chats, args.speed, args.concurrency)
+            results["cache_hit_rates"] = cache_hit_rates(base_url)
+        finally:
+            app.terminate()
+            app.wait()
+            cassette.shutdown()
+
+    results["recorded_latency"] = latency_summary([entry["seconds"] for entry in chats])
+    results["cassette"] = {
+        "recordings": len(cassette.cassette),
+        "hits": dict(cassette.cassette_hits),
+        "misses": dict(cassette.cassette_misses),
+    }
+    results["upstream_requests"] = dict(cassette.requests)
+    results["config"] = {
+        "log": os.path.abspath(args.log),
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "threads": args.threads,
+        "upstream_latency": args.upstream_latency,
+        "cache_backend": args.cache_backend,
+    }
+
+    print(f"{results['requests']} requests in {results['duration_s']}s: {results['throughput_rps']} req/s")
+    recorded = results["recorded_latency"]
+    print(f"  recorded  n={recorded['count']:5}  p50={recorded['p50_ms']:8.1f}ms  "
+          f"p95={recorded['p95_ms']:8.1f}ms  p99={recorded['p99_ms']:8.1f}ms")
+    for intent, summary in sorted(results["latency"].items()):
+        print(f"  {intent:8}  n={summary['count']:5}  p50={summary['p50_ms']:8.1f}ms  "
+              f"p95={summary['p95_ms']:8.1f}ms  p99={summary['p99_ms']:8.1f}ms  errors={summary['errors']}")
+    print(f"  cache hit rates: {results['cache_hit_rates']}")
+    print(f"  cassette hits: {results['cassette']['hits']}  misses: {results['cassette']['misses']}")
+    print(f"  replies differing from the recording: {results['mismatched_replies']}")
+    print(f"Saved {save_results('replay', results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Helpers for saving benchmark results as JSON and comparing two runs.
+
+Usage: python benchmarks/results.py OLD.json NEW.json
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import List
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    """Count and p50/p95/p99/mean in milliseconds."""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(RESULTS_DIR), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(kind: str, results: dict, path: str = None) -> str:
+    """Writes results with run metadata; defaults to benchmarks/results/<kind>-<timestamp>.json."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    document = {
+        "kind": kind,
+        "revision": _git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    return path
+
+
+def _flatten(value, prefix=""):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _flatten(child, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def compare(old_path: str, new_path: str) -> List[str]:
+    """One line per numeric metric present in both runs, with the relative change."""
+    with open(old_path, encoding="utf-8") as f:
+        old = dict(_flatten(json.load(f)["results"]))
+    with open(new_path, encoding="utf-8") as f:
+        new = dict(_flatten(json.load(f)["results"]))
+
+    lines = []
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name], new[name]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        lines.append(f"{name:50} {before:>12.2f} -> {after:>12.2f}  {change}")
+    return lines
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__.strip())
+    print("\n".join(compare(sys.argv[1], sys.argv[2])))
@@ -0,0 +1,229 @@
+"""
+Local stand-ins for Photon, Overpass and Open-Meteo with configurable latency,
+jitter and error rate, for load tests that must not touch the public APIs.
+
+Usage: python benchmarks/stubs.py [--port 8900] [--latency 0.2] [--jitter 0.05] [--error-rate 0.01]
+
+Point the agents at them with:
+    PHOTON_URL=http://127.0.0.1:8900/photon/api/
+    OPEN_METEO_URL=http://127.0.0.1:8900/open-meteo/v1/forecast
+    OVERPASS_URL=http://127.0.0.1:8900/overpass/api/interpreter
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+PATHS = {
+    "photon": "/photon/api/",
+    "open_meteo": "/open-meteo/v1/forecast",
+    "overpass": "/overpass/api/interpreter",
+}
+
+
+class UpstreamProfile:
+    """Latency model for one stubbed upstream."""
+
+    def __init__(self, latency: float = 0.1, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self) -> float:
+        return max(random.gauss(self.latency, self.jitter), 0.0)
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+def _seed(text: str) -> int:
+    """Stable per-name seed so repeated lookups return identical data."""
+    return int(hashlib.md5(text.lower().encode("utf-8")).hexdigest()[:8], 16)
+
+
+def photon_response(query: str) -> dict:
+    rng = random.Random(_seed(query))
+    if query.lower() in ("tomorrow", "today", "xyz"):
+        return {"features": []}
+    features = []
+    for index, country in enumerate(["IN", "US", "AU"]):
+        features.append({
+            "geometry": {"coordinates": [rng.uniform(68, 97), rng.uniform(8, 35)]},
+            "properties": {
+                "name": query,
+                "countrycode": country,
+                "osm_type": rng.choice("RWN"),
+                "osm_id": rng.randint(1, 10_000_000),
+                "admin_level": str(rng.choice([4, 5, 6, 8])),
+                "population": str(rng.randint(10_000, 10_000_000)),
+            },
+        })
+    return {"features": features}
+
+
+def open_meteo_response(latitudes: str, longitudes: str):
+    locations = []
+    for lat, lon in zip(latitudes.split(","), longitudes.split(",")):
+        rng = random.Random(_seed(f"{lat},{lon}"))
+        locations.append({
+            "latitude": float(lat),
+            "longitude": float(lon),
+            "current": {
+                "temperature_2m": round(rng.uniform(15, 38), 1),
+                "precipitation_probability": rng.randint(0, 100),
+            },
+        })
+    return locations[0] if len(locations) == 1 else locations
+
+
+def _elements(seed: str, count: int) -> list:
+    rng = random.Random(_seed(seed))
+    return [
+        {"type": "node", "id": rng.randint(1, 10**9), "lat": rng.uniform(-90, 90), "lon": rng.uniform(-180, 180),
+         "tags": {"name": f"Attraction {rng.randint(1, 40)}", "tourism": "attraction"}}
+        for _ in range(count)
+    ]
+
+
+def overpass_response(query: str) -> dict:
+    """
+    Mirrors the shape get_places expects: with an area, an `out count` element before
+    each result set. Roughly one area in five is empty, to exercise the fallback.
+    """
+    area = re.search(r"area\((\d+)\)", query)
+    if not area:
+        return {"elements": _elements(query, 10)}
+    area_id = area.group(1)
+    area_elements = [] if _seed(area_id) % 5 == 0 else _elements(area_id, 10)
+    return {"elements": (
+        [{"type": "count", "tags": {"total": str(len(area_elements))}}] + area_elements
+        + [{"type": "count", "tags": {"total": "10"}}] + _elements(query, 10)
+    )}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # get_places closes Overpass responses once it has enough places; not an error
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _serve(self, upstream: str, build) -> None:
+        profile = self.server.profiles[upstream]
+        self.server.count(upstream)
+        time.sleep(profile.delay())
+        if profile.fails():
+            self._send_json(503, {"error": "stub failure"})
+        else:
+            self._send_json(200, build())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        if url.path == PATHS["photon"]:
+            self._serve("photon", lambda: photon_response(params.get("q", [""])[0]))
+        elif url.path == PATHS["open_meteo"]:
+            self._serve("open_meteo", lambda: open_meteo_response(params["latitude"][0], params["longitude"][0]))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.handle_post(self.rfile.read(length).decode("utf-8"))
+
+    def handle_post(self, body: str) -> None:
+        if urlsplit(self.path).path == PATHS["overpass"]:
+            # Overpass accepts the query raw or form-encoded as data=...
+            query = parse_qs(body).get("data", [body])[0] if body.startswith("data=") else body
+            self._serve("overpass", lambda: overpass_response(query))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, profiles: Dict[str, UpstreamProfile]):
+        super().__init__(address, StubHandler)
+        self.profiles = profiles
+        self.requests = {name: 0 for name in profiles}
+        self._lock = threading.Lock()
+
+    def count(self, upstream: str) -> None:
+        with self._lock:
+            self.requests[upstream] += 1
+
+    def urls(self) -> Dict[str, str]:
+        """Environment variables that point the agents at this server."""
+        host, port = self.server_address[:2]
+        base = f"http://{host}:{port}"
+        return {
+            "PHOTON_URL": base + PATHS["photon"],
+            "OPEN_METEO_URL": base + PATHS["open_meteo"],
+            "OVERPASS_URL": base + PATHS["overpass"],
+        }
+
+
+def start_stubs(profiles: Dict[str, UpstreamProfile], port: int = 0) -> StubServer:
+    """Starts the stub server in a daemon thread; port 0 picks a free port."""
+    server = StubServer(("127.0.0.1", port), profiles)
+    threading.Thread(target=server.serve_forever, name="upstream-stubs", daemon=True).start()
+    return server
+
+
+def default_profiles(latency: float = None, jitter: float = None, error_rate: float = None) -> Dict[str, UpstreamProfile]:
+    """Rough production shape: Overpass is the slow one. Arguments override all three."""
+    profiles = {
+        "photon": UpstreamProfile(0.15, 0.05, 0.0),
+        "open_meteo": UpstreamProfile(0.1, 0.03, 0.0),
+        "overpass": UpstreamProfile(0.8, 0.3, 0.0),
+    }
+    for profile in profiles.values():
+        if latency is not None:
+            profile.latency = latency
+        if jitter is not None:
+            profile.jitter = jitter
+        if error_rate is not None:
+            profile.error_rate = error_rate
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run stub Photon/Overpass/Open-Meteo servers.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, help="mean latency in seconds for all upstreams")
+    parser.add_argument("--jitter", type=float, help="latency standard deviation in seconds")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = start_stubs(default_profiles(args.latency, args.jitter, args.error_rate), args.port)
+    for name, url in server.urls().items():
+        print(f"{name}={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
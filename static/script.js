@@ -47,16 +47,60 @@ chatForm.addEventListener('submit', async (e) => {
     showLoading();
 
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ message })
         });
-        const data = await response.json();
+        if (!response.ok || !response.body) {
+            const data = await response.json();
+            removeLoading();
+            addMessage(data.response, false);
+            return;
+        }
+
+        // Render each part as it arrives; keep the typing indicator below it until done
+        let received = 0;
+        await readEvents(response.body, (event, data) => {
+            if (event !== 'part') return;
+            received++;
+            removeLoading();
+            addMessage(JSON.parse(data).response, false);
+            showLoading();
+        });
         removeLoading();
-        addMessage(data.response, false);
+        if (!received) {
+            addMessage("Sorry, something went wrong. Please try again.", false);
+        }
     } catch (error) {
         removeLoading();
         addMessage("Sorry, something went wrong. Please check your connection.", false);
     }
 });
+
+// Parses a server-sent events stream, calling onEvent(event, data) for each event
+async function readEvents(body, onEvent) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const frame = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const data = [];
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+            }
+            onEvent(event, data.join('\n'));
+        }
+    }
+}
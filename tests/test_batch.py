@@ -0,0 +1,49 @@
+"""
+/chat/batch against the local upstream stubs: a batch needing more Overpass calls
+than the limiter lets through within one message deadline must still finish
+with every part answered.
+
+Run with: python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.stubs import default_profiles, start_stubs
+
+_stubs = start_stubs(default_profiles(latency=0.05, jitter=0, error_rate=0))
+# The agents read their configuration on import
+os.environ.update(_stubs.urls())
+os.environ.update({
+    "CACHE_BACKEND": "memory",
+    "GEOCODE_CACHE_PATH": "",
+    "WARM_ENABLED": "0",
+    "CHAT_DEADLINE": "0.5",
+    "OVERPASS_MAX_IN_FLIGHT": "2",
+    "OVERPASS_RATE": "10",
+})
+
+from agents.parent import ParentAgent  # noqa: E402
+
+CITIES = ["Mumbai", "Delhi", "Bangalore", "Goa", "Jaipur", "Chennai", "Kolkata", "Hyderabad",
+          "Pune", "Agra", "Udaipur", "Varanasi", "Kochi", "Mysore", "Shimla", "Manali"]
+
+
+class BatchDeadlineTest(unittest.TestCase):
+    def test_batch_wider_than_overpass_limits_has_no_late_parts(self):
+        # 16 Overpass calls at 2 in flight and 10/s take well over the 0.5 s message deadline
+        messages = [f"weather and attractions in {city}" for city in CITIES] * 3
+        replies = ParentAgent().process_batch(messages)
+
+        self.assertEqual(len(replies), len(messages))
+        for message, reply in zip(messages, replies):
+            self.assertNotIn("took too long", reply, message)
+            self.assertNotIn("unavailable", reply, message)
+            self.assertIn("places you can go", reply, message)
+
+
+if __name__ == "__main__":
+    unittest.main()